@@ -0,0 +1,284 @@
+import hashlib
+import logging
+import re
+import threading
+import time
+from typing import Any, Collection, Dict, Iterator, List, Optional, Tuple
+
+from .model import CategoricalColumnDump, ColumnDump, CompositeColumnDump, NumberColumnDump, ServerRankingDump
+
+StrDict = Dict[str, Any]
+
+# prefix of the indexes owned by the advisor, other indexes are never dropped
+INDEX_PREFIX = "lineup_idx_"
+# identifiers outside of string and quoted literals
+_IDENTIFIER = re.compile(r"'[^']*'|\"[^\"]*\"|\b([A-Za-z_]\w*)\b")
+# key width of a computed score, a double precision
+SCORE_WIDTH = 8
+
+
+class Latency:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, elapsed: float):
+        self.count += 1
+        self.total += elapsed
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.total / self.count if self.count else None
+
+
+# an index that would support a sort order or a filter predicate seen in the workload
+class IndexCandidate:
+    def __init__(self, table: str, expressions: Tuple[str, ...], columns: Collection[str], filter: bool = False):
+        self.table = table
+        self.expressions = expressions
+        # the columns referenced by each expression
+        self.references = [to_references(e, columns) for e in expressions]
+        # single column filter, either a partial btree or a block range index
+        self.filter = filter
+        self.method = "btree"
+        # ranges and category sets never match missing values, thus the index can skip them
+        self.predicate = "{0} IS NOT NULL".format(expressions[0]) if filter else None
+        key = "{0}|{1}|{2}".format(table, ",".join(expressions), filter)
+        self.name = INDEX_PREFIX + hashlib.md5(key.encode("utf-8")).hexdigest()[:16]
+        self.uses = 0.0
+        self.indexed = False
+        # the index turned out to not speed up the queries
+        self.rejected = False
+        self.estimated_size = 0
+        self.size = 0
+        self.before = Latency()
+        self.after = Latency()
+
+    def to_ddl(self) -> str:
+        ddl = "CREATE INDEX CONCURRENTLY IF NOT EXISTS {0} ON {1} USING {2} ({3})".format(self.name, self.table, self.method, ", ".join(self.expressions))
+        return ddl + " WHERE " + self.predicate if self.predicate else ddl
+
+    def to_dict(self) -> StrDict:
+        before, after = self.before.mean, self.after.mean
+        return dict(
+            name=self.name,
+            method=self.method,
+            expressions=list(self.expressions),
+            predicate=self.predicate,
+            uses=self.uses,
+            indexed=self.indexed,
+            rejected=self.rejected,
+            estimatedSize=self.estimated_size,
+            size=self.size,
+            before=dict(count=self.before.count, mean=before),
+            after=dict(count=self.after.count, mean=after),
+            speedup=before / after if before and after else None,
+        )
+
+
+def to_references(expression: str, columns: Collection[str]) -> List[str]:
+    return [m.group(1) for m in _IDENTIFIER.finditer(expression) if m.group(1) in columns]
+
+
+def iter_columns(dumps: List[ColumnDump]) -> Iterator[str]:
+    for dump in dumps:
+        if isinstance(dump, CompositeColumnDump):
+            yield from iter_columns(dump.children)
+        else:
+            yield dump.column
+
+
+def to_sort_expressions(ranking_dump: ServerRankingDump) -> Tuple[str, ...]:
+    # the same keys as the order of the sort queries, grouped ones rank within the partition of the group name
+    clauses = [e for c in ranking_dump.sort_criteria for e in c.to_clauses()]
+    if ranking_dump.group_criteria:
+        return tuple([ranking_dump.to_group_name()] + clauses + ["id"])
+    if clauses:
+        return tuple(clauses + ["id"])
+    return ()
+
+
+# records the sort orders and filters used by the requests along with their latencies and periodically
+# creates the indexes with the best uses per byte within the storage budget and drops the others
+class IndexAdvisor:
+    def __init__(self, table: str, budget: int, min_uses: int = 5, enabled: bool = True, max_decisions: int = 100, max_candidates: int = 1000):
+        self.table = table
+        self.budget = budget
+        self.min_uses = min_uses
+        self.enabled = enabled
+        self.max_decisions = max_decisions
+        self.max_candidates = max_candidates
+        self.decisions: List[StrDict] = []
+        self._candidates: Dict[str, IndexCandidate] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.rounds = 0
+
+    def candidates_of(self, ranking_dump: ServerRankingDump, columns: Collection[str], sort: bool = True) -> List[IndexCandidate]:
+        # the expressions end up in DDL, thus rankings referencing anything else than the given columns are ignored
+        dumps = ranking_dump.filter + ranking_dump.group_criteria + [c.col for c in ranking_dump.sort_criteria]
+        if any(column not in columns for column in iter_columns(dumps)):
+            return []
+        found = []
+        expressions = to_sort_expressions(ranking_dump) if sort else ()
+        if expressions:
+            found.append(IndexCandidate(self.table, expressions, columns))
+        for f in ranking_dump.filter:
+            if f.filter is None or not isinstance(f, (NumberColumnDump, CategoricalColumnDump)):
+                continue
+            found.append(IndexCandidate(self.table, (f.column,), columns, filter=True))
+        return found
+
+    def record(self, candidates: List[IndexCandidate], elapsed: float):
+        if not self.enabled:
+            return
+        with self._lock:
+            for candidate in candidates:
+                if candidate.name not in self._candidates and len(self._candidates) >= self.max_candidates:
+                    # every dragged mapping or weight is a new expression, the least used one makes room
+                    evictable = [c for c in self._candidates.values() if not c.indexed]
+                    if not evictable:
+                        continue
+                    del self._candidates[min(evictable, key=lambda c: c.uses).name]
+                known = self._candidates.setdefault(candidate.name, candidate)
+                known.uses += 1
+                (known.after if known.indexed else known.before).add(elapsed)
+
+    def start(self, engine: Any, interval: float):
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.advise(engine)
+                except Exception as e:
+                    logging.getLogger(__name__).warning("index advisor failed: %s", e)
+
+        self._thread = threading.Thread(target=run, name="lineup-index-advisor", daemon=True)
+        self._thread.start()
+
+    def _load_statistics(self, connection: Any) -> Tuple[float, Dict[str, Any]]:
+        from sqlalchemy import text
+
+        rows = connection.execute(text("select reltuples from pg_class where relname = :t"), dict(t=self.table)).scalar() or 0
+        stats = {
+            row["attname"]: row
+            for row in connection.execute(text("select attname, avg_width, null_frac, correlation from pg_stats where tablename = :t"), dict(t=self.table))
+        }
+        return rows, stats
+
+    def _estimate(self, rows: float, stats: Dict[str, Any]):
+        for candidate in self._candidates.values():
+            width = sum(self._width(e, references, stats) for e, references in zip(candidate.expressions, candidate.references))
+            first = stats.get(candidate.references[0][0]) if candidate.references[0] else None
+            if candidate.filter and not candidate.indexed:
+                # physically ordered columns are better served by a tiny block range index
+                correlated = first is not None and first["correlation"] is not None and abs(first["correlation"]) >= 0.9
+                candidate.method = "brin" if correlated else "btree"
+                candidate.predicate = None if correlated else "{0} IS NOT NULL".format(candidate.expressions[0])
+            if candidate.method == "brin":
+                # one summary per 128 pages
+                candidate.estimated_size = max(8192, int(rows * width / 128 / 100))
+            else:
+                # a btree entry is about the key width plus tuple header and item pointer
+                fraction = 1.0 - (first["null_frac"] or 0.0) if candidate.predicate and first is not None else 1.0
+                candidate.estimated_size = int(rows * fraction * (width + 16) / 0.9)
+
+    @staticmethod
+    def _width(expression: str, references: List[str], stats: Dict[str, Any]) -> int:
+        if "map_value(" in expression:
+            return SCORE_WIDTH
+        return sum(stats[c]["avg_width"] if c in stats else 8 for c in references)
+
+    def _choose(self) -> List[IndexCandidate]:
+        # greedy by uses per byte, candidates which did not pay off are skipped
+        ranked = sorted(
+            (c for c in self._candidates.values() if c.uses >= self.min_uses and not c.rejected),
+            key=lambda c: c.uses / max(c.estimated_size, 1),
+            reverse=True,
+        )
+        chosen, used = [], 0
+        for candidate in ranked:
+            size = candidate.size if candidate.indexed else candidate.estimated_size
+            if used + size <= self.budget:
+                chosen.append(candidate)
+                used += size
+        return chosen
+
+    def _decide(self, action: str, candidate: IndexCandidate, reason: str):
+        with self._lock:
+            self.decisions.append(dict(time=time.time(), action=action, name=candidate.name, definition=candidate.to_ddl(), reason=reason))
+            del self.decisions[: -self.max_decisions]
+        logging.getLogger(__name__).info("%s index %s: %s", action, candidate.to_ddl(), reason)
+
+    def advise(self, engine: Any):
+        from sqlalchemy import text
+
+        # concurrent index builds cannot run within a transaction
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            existing = {
+                row[0]: row[1]
+                for row in connection.execute(
+                    text("select indexname, pg_relation_size(cast(indexname as regclass)) from pg_indexes where tablename = :t"), dict(t=self.table)
+                )
+            }
+            rows, stats = self._load_statistics(connection)
+            with self._lock:
+                for candidate in self._candidates.values():
+                    candidate.indexed = candidate.name in existing
+                    candidate.size = existing.get(candidate.name, 0)
+                    # an index that does not make the queries at least 10% faster is not worth its maintenance
+                    if candidate.indexed and candidate.after.count >= self.min_uses and candidate.before.count >= self.min_uses:
+                        if candidate.after.mean > candidate.before.mean * 0.9:
+                            candidate.rejected = True
+                self._estimate(rows, stats)
+                chosen = {c.name for c in self._choose()}
+                drop = [c for c in self._candidates.values() if c.indexed and c.name not in chosen]
+                create = [c for c in self._candidates.values() if not c.indexed and c.name in chosen]
+                # indexes of a previous server run which were not used since one round
+                orphans = [name for name in existing if name.startswith(INDEX_PREFIX) and name not in self._candidates] if self.rounds else []
+                self.rounds += 1
+
+            for name in orphans:
+                connection.execute(text("DROP INDEX CONCURRENTLY IF EXISTS {0}".format(name)))
+                logging.getLogger(__name__).info("drop unused index %s", name)
+            for candidate in drop:
+                connection.execute(text("DROP INDEX CONCURRENTLY IF EXISTS {0}".format(candidate.name)))
+                with self._lock:
+                    candidate.indexed = False
+                    candidate.size = 0
+                if candidate.rejected:
+                    reason = "no speedup"
+                elif candidate.uses < self.min_uses:
+                    reason = "unused"
+                else:
+                    reason = "outranked within the budget"
+                self._decide("drop", candidate, reason)
+            for candidate in create:
+                start = time.perf_counter()
+                connection.execute(text(candidate.to_ddl()))
+                size = connection.execute(text("select pg_relation_size(cast(:i as regclass))"), dict(i=candidate.name)).scalar() or 0
+                with self._lock:
+                    candidate.size = size
+                    candidate.indexed = True
+                self._decide("create", candidate, "{0:.0f} uses, built in {1:.1f}s".format(candidate.uses, time.perf_counter() - start))
+
+            with self._lock:
+                self._fade()
+
+    def _fade(self):
+        # older workload fades out, candidates without an index and hardly any recent use are forgotten
+        for candidate in list(self._candidates.values()):
+            candidate.uses /= 2
+            if candidate.uses < 1 and not candidate.indexed and not candidate.rejected:
+                del self._candidates[candidate.name]
+
+    def report(self) -> StrDict:
+        with self._lock:
+            candidates = sorted(self._candidates.values(), key=lambda c: c.uses, reverse=True)
+            return dict(
+                enabled=self.enabled,
+                budget=self.budget,
+                used=sum(c.size for c in candidates if c.indexed),
+                candidates=[c.to_dict() for c in candidates],
+                decisions=list(self.decisions),
+            )
@@ -0,0 +1,43 @@
+import datetime
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from .model import ComputeColumnDump, ServerRankingDump
+
+StrDict = Dict[str, Any]
+DateBuckets = Dict[int, Tuple[str, List[datetime.date]]]
+
+
+# the dataset dependent parameters of the aggregates of a stats request
+class StatsLayout:
+    def __init__(self, bins: int, date_buckets: DateBuckets, categories: Dict[int, List[str]], approximate_boxplot: bool = False):
+        self.bins = bins
+        self.date_buckets = date_buckets
+        self.categories = categories
+        # whether boxplots may be estimated using a quantile sketch
+        self.approximate_boxplot = approximate_boxplot
+
+
+# interface of an alternative execution engine to the PostgreSQL queries in api.py
+#
+# aggregates have to return the same keys and values as the SQL aggregates in functions.sql
+# (stats{i}, nstats{i}, boxplot{i}, nboxplot{i}, cathist{i}, dstats{i}) such that the results
+# are converted to LineUp statistics by the very same code
+class Backend:
+    version = 0
+
+    def rows(self, ids: List[int], columns: List[str]) -> List[Optional[Sequence[Any]]]:
+        raise NotImplementedError()
+
+    def iter_rows(self, columns: List[str], batch_size: int) -> Iterator[Tuple[List[str], List[Sequence[Any]]]]:
+        raise NotImplementedError()
+
+    def sort(self, ranking: ServerRankingDump, offset: int = 0, limit: Optional[int] = None) -> StrDict:
+        raise NotImplementedError()
+
+    def aggregate(self, cols: List[ComputeColumnDump], layout: StatsLayout, ranking: Optional[ServerRankingDump] = None, group: Optional[str] = None) -> StrDict:
+        raise NotImplementedError()
+
+    def aggregate_groups(self, cols: List[ComputeColumnDump], layout: StatsLayout, ranking: ServerRankingDump) -> List[Tuple[str, StrDict]]:
+        raise NotImplementedError()
+
+    def search(self, column: str, query: str, limit: int) -> List[int]:
+        raise NotImplementedError()
@@ -0,0 +1,244 @@
+import argparse
+import json
+import math
+import random
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.request import Request, urlopen
+
+# replays a mix of LineUp like requests against a running server and reports latency percentiles, throughput and memory
+#
+#   python -m lineup_remote.benchmark --url http://localhost:8080 --duration 60 --concurrency 8 --pid <server pid> \
+#     --label postgres --output postgres.json [--baseline previous.json]
+#
+# the server defines the execution engine, e.g. run once with LINEUP_BACKEND=postgres and once with numpy
+
+StrDict = Dict[str, Any]
+# name, method, path and JSON body
+Call = Tuple[str, str, str, Optional[Any]]
+
+DEFAULT_MIX = "sort=2,sort_all=1,stats=3,group_stats=1,rows=3,search=1"
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    # nearest rank
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def rss_of(pid: int) -> Optional[int]:
+    try:
+        with open("/proc/{0}/status".format(pid)) as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+# random rankings and statistics requests derived from the column descriptions of the server
+class Workload:
+    def __init__(self, desc: List[StrDict], count: int, rng: random.Random):
+        self.count = count
+        self.rng = rng
+        self.numbers = [d for d in desc if d["type"] == "number"]
+        self.categoricals = [d for d in desc if d["type"] == "categorical"]
+        self.dates = [d for d in desc if d["type"] == "date"]
+        self.strings = [d for d in desc if d["type"] == "string"]
+
+    def dump(self, d: StrDict, with_filter: bool = False) -> StrDict:
+        dump: StrDict = dict(id=d["column"], desc="{0}@{1}".format(d["type"], d["column"]))
+        if d["type"] == "number":
+            dump.update(map=dict(type="linear", domain=d["domain"], range=[0, 1]), groupSortMethod="median")
+            if with_filter:
+                low, high = sorted(self.rng.uniform(d["domain"][0], d["domain"][1]) for _ in range(2))
+                dump["filter"] = dict(min=low, max=high, filterMissing=False)
+        elif d["type"] == "categorical" and with_filter:
+            categories = d["categories"]
+            dump["filter"] = dict(filter=self.rng.sample(categories, max(1, len(categories) // 2)), filterMissing=False)
+        return dump
+
+    def ranking(self) -> StrDict:
+        filterable = self.numbers + self.categoricals
+        filters = [self.dump(d, True) for d in self.rng.sample(filterable, min(len(filterable), self.rng.randint(0, 2)))]
+        sort = [dict(col=self.dump(self.rng.choice(self.numbers)), asc=self.rng.random() < 0.5)] if self.numbers else []
+        group = [self.dump(self.rng.choice(self.categoricals))] if self.categoricals and self.rng.random() < 0.3 else []
+        return dict(filter=filters, sortCriteria=sort, groupCriteria=group, groupSortCriteria=[])
+
+    def columns(self) -> List[StrDict]:
+        columns = [dict(type="number", dump=self.dump(d)) for d in self.numbers]
+        columns += [dict(type="boxplot", dump=self.dump(d)) for d in self.numbers[:1]]
+        columns += [dict(type="categorical", dump=self.dump(d)) for d in self.categoricals]
+        columns += [dict(type="date", dump=self.dump(d)) for d in self.dates]
+        return columns
+
+    def sort(self) -> Call:
+        # first page of a scrolled ranking
+        return "sort", "POST", "/api/ranking/sort?offset=0&limit=100", self.ranking()
+
+    def sort_all(self) -> Call:
+        return "sort_all", "POST", "/api/ranking/sort", self.ranking()
+
+    def stats(self) -> Call:
+        return "stats", "POST", "/api/ranking/stats", dict(ranking=self.ranking(), columns=self.columns())
+
+    def group_stats(self) -> Call:
+        ranking = self.ranking()
+        if self.categoricals:
+            ranking["groupCriteria"] = [self.dump(self.rng.choice(self.categoricals))]
+        return "group_stats", "POST", "/api/ranking/groups/stats", dict(ranking=ranking, columns=self.columns())
+
+    def rows(self) -> Call:
+        # visible rows of a scrolled table
+        start = self.rng.randint(1, max(1, self.count - 100))
+        return "rows", "POST", "/api/row/", list(range(start, start + 100))
+
+    def search(self) -> Call:
+        if not self.strings:
+            return self.rows()
+        column = self.rng.choice(self.strings)["column"]
+        return "search", "GET", "/api/column/{0}/search?query=Row{1}&limit=100".format(column, self.rng.randint(1, 999)), None
+
+
+def request(url: str, method: str, path: str, body: Optional[Any]) -> Tuple[int, int]:
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    req = Request(url + path, data=data, method=method, headers={"Content-Type": "application/json"})
+    try:
+        with urlopen(req) as response:
+            return response.status, len(response.read())
+    except Exception as e:
+        return getattr(e, "code", 0), 0
+
+
+def parse_mix(mix: str) -> List[Tuple[str, float]]:
+    entries = [entry.split("=") for entry in mix.split(",") if entry]
+    return [(name, float(weight)) for name, weight in entries]
+
+
+def run(url: str, workload: Workload, mix: List[Tuple[str, float]], duration: float, concurrency: int, pid: Optional[int]) -> StrDict:
+    generators: List[Callable[[], Call]] = [getattr(workload, name) for name, _ in mix]
+    weights = [weight for _, weight in mix]
+    samples: Dict[str, List[float]] = {}
+    errors: Dict[str, int] = {}
+    memory: List[int] = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        while time.perf_counter() < deadline:
+            with lock:
+                name, method, path, body = workload.rng.choices(generators, weights)[0]()
+            start = time.perf_counter()
+            status, _ = request(url, method, path, body)
+            elapsed = time.perf_counter() - start
+            with lock:
+                samples.setdefault(name, []).append(elapsed)
+                if status != 200:
+                    errors[name] = errors.get(name, 0) + 1
+
+    def sampler():
+        while time.perf_counter() < deadline:
+            rss = rss_of(pid) if pid else None
+            if rss is not None:
+                memory.append(rss)
+            time.sleep(0.5)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)] + [threading.Thread(target=sampler)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    endpoints = {}
+    for name, values in sorted(samples.items()):
+        endpoints[name] = dict(
+            count=len(values),
+            errors=errors.get(name, 0),
+            p50=percentile(values, 50),
+            p95=percentile(values, 95),
+            p99=percentile(values, 99),
+            mean=sum(values) / len(values),
+            throughput=len(values) / elapsed,
+        )
+    total = sum(len(v) for v in samples.values())
+    return dict(
+        endpoints=endpoints,
+        requests=total,
+        throughput=total / elapsed,
+        memory=dict(peak=max(memory), last=memory[-1]) if memory else None,
+    )
+
+
+def print_report(result: StrDict, baseline: Optional[StrDict]):
+    print("{0:<12} {1:>7} {2:>6} {3:>9} {4:>9} {5:>9} {6:>8}  {7}".format("endpoint", "count", "errors", "p50 ms", "p95 ms", "p99 ms", "req/s", "p95 vs baseline"))
+    for name, e in result["endpoints"].items():
+        ratio = ""
+        if baseline and name in baseline["endpoints"]:
+            ratio = "{0:.2f}x".format(e["p95"] / baseline["endpoints"][name]["p95"])
+        print(
+            "{0:<12} {1:>7} {2:>6} {3:>9.1f} {4:>9.1f} {5:>9.1f} {6:>8.1f}  {7}".format(
+                name, e["count"], e["errors"], e["p50"] * 1000, e["p95"] * 1000, e["p99"] * 1000, e["throughput"], ratio
+            )
+        )
+    print("total {0} requests, {1:.1f} req/s".format(result["requests"], result["throughput"]))
+    if result["memory"]:
+        print("server memory: peak {0:.1f} MB, last {1:.1f} MB".format(result["memory"]["peak"] / 2 ** 20, result["memory"]["last"] / 2 ** 20))
+
+
+def regressions(result: StrDict, baseline: StrDict, tolerance: float) -> List[str]:
+    return [
+        name
+        for name, e in result["endpoints"].items()
+        if name in baseline["endpoints"] and e["p95"] > baseline["endpoints"][name]["p95"] * (1 + tolerance)
+    ]
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="benchmark a LineUp remote server with a mix of requests")
+    parser.add_argument("--url", default="http://localhost:8080")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="weighted request types, e.g. {0}".format(DEFAULT_MIX))
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--pid", type=int, help="process id of the server to sample its memory")
+    parser.add_argument("--label", default="", help="name of the run, e.g. the backend")
+    parser.add_argument("--output", help="file to store the results as JSON")
+    parser.add_argument("--baseline", help="results of a previous run to compare the p95 latencies with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative p95 increase reported as regression")
+    args = parser.parse_args(argv)
+
+    with urlopen(args.url + "/api/desc") as response:
+        desc = json.loads(response.read())
+    with urlopen(args.url + "/api/count") as response:
+        count = json.loads(response.read())
+
+    workload = Workload(desc, count, random.Random(args.seed))
+    result = run(args.url, workload, parse_mix(args.mix), args.duration, args.concurrency, args.pid)
+    result.update(label=args.label, rows=count, concurrency=args.concurrency, duration=args.duration, mix=args.mix)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+    if baseline:
+        slower = regressions(result, baseline, args.tolerance)
+        if slower:
+            print("p95 regressions: {0}".format(", ".join(slower)))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+import datetime
+from typing import Any, cast, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .backend import StatsLayout, StrDict
+from .metadata import Metadata
+from .model import CategoricalFilter, ColumnDump, ComputeColumnDump, DateFilter, NumberColumnDump, NumberFilter, to_date
+from .numpy_backend import _is_null, _to_array, map_value
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.int64)
+
+
+def popcount(bits: np.ndarray) -> int:
+    return int(_POPCOUNT[bits].sum())
+
+
+# bin of every row as one bitmap per bin, 8 rows per byte
+class BinnedColumn:
+    def __init__(self, codes: np.ndarray, nbins: int, values: Optional[np.ndarray] = None):
+        self.nbins = nbins
+        self.bitmaps = [np.packbits(codes == b) for b in range(nbins)]
+        self.counts = [popcount(b) for b in self.bitmaps]
+        # smallest and largest value per bin of ordered columns, to tell whether a range filter just selects whole bins
+        self.lows: List[Any] = []
+        self.highs: List[Any] = []
+        if values is not None:
+            for b in range(nbins):
+                in_bin = values[codes == b]
+                self.lows.append(in_bin.min() if len(in_bin) else None)
+                self.highs.append(in_bin.max() if len(in_bin) else None)
+
+    def histogram(self, bits: Optional[np.ndarray]) -> List[int]:
+        if bits is None:
+            return list(self.counts)
+        return [popcount(np.bitwise_and(b, bits)) for b in self.bitmaps]
+
+    def union(self, bins: List[int]) -> np.ndarray:
+        bits = np.zeros_like(self.bitmaps[0])
+        for b in bins:
+            bits |= self.bitmaps[b]
+        return bits
+
+    def select_range(self, low: Any, high: Any) -> Optional[np.ndarray]:
+        # rows with values within [low, high] if no bin straddles one of the bounds, None otherwise
+        bins = []
+        for b in range(self.nbins):
+            if not self.counts[b]:
+                continue
+            if low is not None and self.highs[b] < low or high is not None and self.lows[b] > high:
+                continue
+            if low is not None and self.lows[b] < low or high is not None and self.highs[b] > high:
+                return None
+            bins.append(b)
+        return self.union(bins)
+
+
+# crossfilter like index of the histogram bins of the number, date and categorical columns of a table
+#
+# the bins are fixed per data version: number columns are binned within the domain of their
+# description, dates within the buckets of their overall range and categorical columns by their categories.
+# filters which select whole bins are evaluated by intersecting bitmaps, the scalar aggregates like the min, max
+# and mean of a filtered subset are left to the database, such that the index holds no copy of the values
+class BitmapIndex:
+    def __init__(self, ids: np.ndarray, version: int = 0):
+        self.ids = ids
+        self.version = version
+        self.domains: Dict[str, Tuple[float, float]] = {}
+        self.bucket_ends: Dict[str, List[datetime.date]] = {}
+        self.categories: Dict[str, List[str]] = {}
+        self.columns: Dict[str, BinnedColumn] = {}
+        # scalar aggregates of all rows, see to_scalar_keys
+        self.totals: Dict[str, StrDict] = {}
+        self.all = np.packbits(np.ones(len(ids), dtype=bool))
+
+    @staticmethod
+    def build(bind: Any, table: str, meta: Metadata, bins: int, bucket_ends: Dict[str, List[datetime.date]], fetch_size: int = 10000) -> "BitmapIndex":
+        descs = [d for d in meta.desc if d["type"] in ("number", "date", "categorical")]
+        names = ["id"] + [d["column"] for d in descs]
+        values: List[List[Any]] = [[] for _ in names]
+        with bind.connect() as connection:
+            r = connection.execution_options(stream_results=True).execute("select {c} from {t} order by id".format(c=", ".join(names), t=table))
+            while True:
+                batch = r.fetchmany(fetch_size)
+                if not batch:
+                    break
+                for column, column_values in zip(values, zip(*batch)):
+                    column.extend(column_values)
+
+        index = BitmapIndex(np.array(values[0], dtype=np.int64), meta.version)
+        for i, desc in enumerate(descs):
+            # the values are just needed while binning them
+            column, column_values = desc["column"], values[i + 1]
+            values[i + 1] = []
+            if desc["type"] == "number":
+                index.add_number(column, np.array([np.nan if v is None else v for v in column_values], dtype=np.float64), bins, desc["domain"])
+            elif desc["type"] == "date":
+                index.add_date(column, _to_array(column_values).astype("datetime64[D]"), bucket_ends[column])
+            else:
+                index.add_categorical(column, column_values, desc["categories"])
+        return index
+
+    def add_number(self, column: str, values: np.ndarray, bins: int, domain: List[float]):
+        missing = np.isnan(values)
+        with np.errstate(all="ignore"):
+            # same bucketing as the stats aggregate
+            codes = np.clip(np.floor((values - domain[0]) * bins / (domain[1] - domain[0])), 0, bins - 1)
+        codes = np.where(missing, bins, codes).astype(np.int64)
+        self.domains[column] = (domain[0], domain[1])
+        self.columns[column] = BinnedColumn(codes, bins, values)
+        valid = values[~missing]
+        count = len(valid)
+        self.totals[column] = dict(
+            min=float(valid.min()) if count else None, max=float(valid.max()) if count else None, sum=float(valid.sum()), count=count
+        )
+
+    def add_date(self, column: str, values: np.ndarray, bucket_ends: List[datetime.date]):
+        missing = _is_null(values)
+        ends = np.array(bucket_ends, dtype="datetime64[D]")
+        codes = np.where(missing, len(ends) + 1, np.searchsorted(ends, values, side="right"))
+        self.bucket_ends[column] = list(bucket_ends)
+        self.columns[column] = BinnedColumn(codes, len(ends) + 1, values)
+        valid = values[~missing]
+        count = len(valid)
+        self.totals[column] = dict(min=valid.min().item() if count else None, max=valid.max().item() if count else None, count=count)
+
+    def add_categorical(self, column: str, values: List[Any], categories: List[str]):
+        # unknown and missing values share the last bin like in the cathist aggregate
+        lookup = {c: i for i, c in enumerate(categories)}
+        codes = np.array([lookup.get(v, len(categories)) for v in values], dtype=np.int64)
+        self.categories[column] = list(categories)
+        self.columns[column] = BinnedColumn(codes, len(categories) + 1)
+
+    def supports(self, cols: List[ComputeColumnDump], layout: StatsLayout) -> bool:
+        for i, col in enumerate(cols):
+            column = col.dump.column
+            if col.type == "number":
+                mapping = cast(NumberColumnDump, col.dump).map
+                if self.domains.get(column) != (mapping.domain[0], mapping.domain[1]) or self.columns[column].nbins != layout.bins:
+                    return False
+                # the normalized histogram is the one of the raw values, just for the default linear mapping onto [0, 1]
+                if not mapping.is_increasing_linear() or list(mapping.range) != [0, 1]:
+                    return False
+            elif col.type == "date":
+                if self.bucket_ends.get(column) != layout.date_buckets[i][1][1:-1]:
+                    return False
+            elif col.type == "categorical":
+                if self.categories.get(column) != layout.categories[i]:
+                    return False
+            else:
+                return False
+        return True
+
+    def filter(self, filters: List[ColumnDump]) -> Tuple[Optional[np.ndarray], List[ColumnDump]]:
+        # bitmap of the rows matching the filters which select whole bins, None for all rows, and the remaining filters
+        bits: Optional[np.ndarray] = None
+        remaining: List[ColumnDump] = []
+        for c in filters:
+            if not c.filter:
+                continue
+            selected = self._select(c)
+            if selected is None:
+                remaining.append(c)
+            else:
+                bits = selected if bits is None else np.bitwise_and(bits, selected)
+        return bits, remaining
+
+    def _select(self, c: ColumnDump) -> Optional[np.ndarray]:
+        f = c.filter
+        binned = self.columns.get(c.column)
+        if binned is None:
+            return None
+        if isinstance(f, CategoricalFilter):
+            categories = self.categories.get(c.column, [])
+            if not all(v in categories for v in f.filter):
+                return None
+            # the missing values are never selected
+            return binned.union([categories.index(v) for v in f.filter])
+        if not isinstance(f, NumberFilter):
+            return None
+        if f.min is None and f.max is None and not f.filter_missing:
+            return self.all
+        if isinstance(f, DateFilter):
+            if c.column not in self.bucket_ends:
+                return None
+            low, high = to_date(f.min, True), to_date(f.max, False)
+            return binned.select_range(np.datetime64(low, "D") if low else None, np.datetime64(high, "D") if high else None)
+        if c.column not in self.domains:
+            return None
+        return binned.select_range(f.min, f.max)
+
+    def count(self, bits: Optional[np.ndarray]) -> int:
+        return popcount(bits) if bits is not None else len(self.ids)
+
+    def to_bitmap(self, ids: List[int]) -> np.ndarray:
+        mask = np.zeros(len(self.ids), dtype=bool)
+        lookup = np.array(ids, dtype=np.int64)
+        positions = np.searchsorted(self.ids, lookup)
+        valid = positions < len(self.ids)
+        positions = positions[valid]
+        mask[positions[self.ids[positions] == lookup[valid]]] = True
+        return np.packbits(mask)
+
+    def to_scalar_keys(self, cols: List[ComputeColumnDump]) -> List[str]:
+        # plain aggregates of the matching rows, which cannot be derived from the bins
+        keys = []
+        for i, col in enumerate(cols):
+            c = col.dump
+            if col.type in ("number", "date"):
+                keys.append("min({c}) as min{i}, max({c}) as max{i}, count({c}) as count{i}".format(c=c.to_value(), i=i))
+            if col.type == "number":
+                keys.append("sum({c}) as sum{i}".format(c=c.to_value(), i=i))
+        return keys
+
+    def aggregate(self, cols: List[ComputeColumnDump], layout: StatsLayout, bits: Optional[np.ndarray], scalars: Optional[StrDict] = None) -> StrDict:
+        # same keys and values as the SQL aggregates, the histograms are counted by intersecting bitmaps
+        # and the scalar aggregates are the given ones of to_scalar_keys or the ones of all rows
+        matched = self.count(bits)
+        r: StrDict = {}
+        for i, col in enumerate(cols):
+            c = col.dump
+            binned = self.columns[c.column]
+            if col.type in ("number", "date"):
+                s = self.totals[c.column] if scalars is None else {k: scalars["{0}{1}".format(k, i)] for k in self.totals[c.column]}
+            if col.type == "number":
+                nc = cast(NumberColumnDump, c)
+                r["stats{0}".format(i)] = self._number_stats(binned, bits, matched, s)
+                low, high, mean = map_value(np.array([_to_float(s["min"]), _to_float(s["max"]), _to_float(r["stats{0}".format(i)]["mean"])]), nc.map)
+                r["nstats{0}".format(i)] = dict(r["stats{0}".format(i)], min=_to_optional(low), max=_to_optional(high), mean=_to_optional(mean))
+            elif col.type == "date":
+                count = s["count"]
+                r["dstats{0}".format(i)] = dict(
+                    min=str(s["min"]) if count else None,
+                    max=str(s["max"]) if count else None,
+                    count=count,
+                    missing=matched - count,
+                    hist=binned.histogram(bits) if matched else [],
+                )
+            elif col.type == "categorical":
+                r["cathist{0}".format(i)] = binned.histogram(bits) if matched else []
+        return r
+
+    def _number_stats(self, binned: BinnedColumn, bits: Optional[np.ndarray], matched: int, s: StrDict) -> StrDict:
+        if not matched:
+            return dict(min=None, max=None, mean=None, count=0, missing=0, hist=[])
+        count = s["count"]
+        return dict(
+            min=_to_optional(_to_float(s["min"])),
+            max=_to_optional(_to_float(s["max"])),
+            mean=_to_float(s["sum"]) / count if count else None,
+            count=count,
+            missing=matched - count,
+            hist=binned.histogram(bits),
+        )
+
+
+def _to_float(value: Any) -> float:
+    return np.nan if value is None else float(value)
+
+
+def _to_optional(value: float) -> Optional[float]:
+    return None if np.isnan(value) else float(value)
@@ -0,0 +1,82 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+# thread safe LRU cache bounded by the number of entries and their estimated size,
+# all entries are bound to a data version and dropped as soon as another version is seen
+class ResultCache:
+    def __init__(self, max_entries: int = 128, max_size: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.version: Optional[int] = None
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _check_version(self, version: int):
+        if self.version == version:
+            return
+        if self._entries:
+            self.invalidations += 1
+        self._entries.clear()
+        self.size = 0
+        self.version = version
+
+    def get(self, key: Hashable, version: int) -> Optional[Any]:
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def touch(self, key: Hashable, version: int) -> bool:
+        # marks an entry as recently used without counting a hit
+        with self._lock:
+            self._check_version(version)
+            if key not in self._entries:
+                return False
+            self._entries.move_to_end(key)
+            return True
+
+    def put(self, key: Hashable, version: int, value: Any, size: int):
+        if self.max_entries <= 0 or size > self.max_size:
+            return
+        with self._lock:
+            self._check_version(version)
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._entries[key] = (value, size)
+            self.size += size
+            while len(self._entries) > self.max_entries or self.size > self.max_size:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(
+                entries=len(self._entries),
+                size=self.size,
+                maxEntries=self.max_entries,
+                maxSize=self.max_size,
+                version=self.version,
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+                invalidations=self.invalidations,
+            )
@@ -1,5 +1,7 @@
 
 DROP TABLE IF EXISTS rows;
+DROP TABLE IF EXISTS data_version;
+DROP TABLE IF EXISTS stats_summary;
 DROP SEQUENCE IF EXISTS rows_id_seq;
 
 CREATE SEQUENCE rows_id_seq;
@@ -15,6 +17,46 @@ CREATE TABLE rows
     CONSTRAINT rows_pkey PRIMARY KEY (id)
 );
 
+-- column comments are used as the labels of the column descriptions
+COMMENT ON COLUMN rows.d IS 'D';
+COMMENT ON COLUMN rows.a IS 'A';
+COMMENT ON COLUMN rows.cat IS 'Cat';
+COMMENT ON COLUMN rows.cat2 IS 'Cat Label';
+COMMENT ON COLUMN rows.dd IS 'Date';
+
+-- generation number per table, bumped on every modification to invalidate server side caches
+CREATE TABLE data_version
+(
+    table_name text NOT NULL,
+    generation bigint NOT NULL DEFAULT 0,
+    CONSTRAINT data_version_pkey PRIMARY KEY (table_name)
+);
+
+INSERT INTO data_version(table_name) VALUES ('rows');
+
+CREATE OR REPLACE FUNCTION bump_data_version()
+RETURNS trigger
+AS $$
+BEGIN
+  UPDATE data_version SET generation = generation + 1 WHERE table_name = TG_TABLE_NAME;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER rows_data_version
+  AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON rows
+  FOR EACH STATEMENT EXECUTE PROCEDURE bump_data_version();
+
+-- unfiltered stats per column, valid while their generation matches the data version
+CREATE TABLE stats_summary
+(
+    table_name text NOT NULL,
+    column_key text NOT NULL,
+    generation bigint NOT NULL,
+    stats jsonb NOT NULL,
+    CONSTRAINT stats_summary_pkey PRIMARY KEY (table_name, column_key)
+);
+
 INSERT INTO rows(d, a, cat, cat2, dd)
   SELECT concat('Row', generate_series(1, 10000)) as d,
          random() as a,
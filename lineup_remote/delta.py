@@ -0,0 +1,61 @@
+from typing import Dict, List, Sequence
+
+# edit script turning a previous order into the current one: ranges copied from the previous order and inserted ids.
+# Removed ids are just not copied and moved ranges are copied out of sequence, e.g.
+#   previous [1, 2, 3, 4, 5], current [4, 5, 9, 1, 2] -> [{"copy": [3, 2]}, {"insert": [9]}, {"copy": [0, 2]}]
+Segment = Dict[str, List[int]]
+
+
+def _common_length(previous: Sequence[int], p: int, current: Sequence[int], i: int) -> int:
+    # length of the common run starting at previous[p] and current[i], by galloping slice comparisons
+    limit = min(len(previous) - p, len(current) - i)
+    low, high = 1, 2
+    while high <= limit and previous[p : p + high] == current[i : i + high]:
+        low, high = high, high * 2
+    high = min(high, limit + 1)
+    # previous[p:p + low] matches, previous[p:p + high] does not or is out of bounds
+    while high - low > 1:
+        middle = (low + high) // 2
+        if previous[p + low : p + middle] == current[i + low : i + middle]:
+            low = middle
+        else:
+            high = middle
+    return low
+
+
+def to_delta(previous: Sequence[int], current: Sequence[int]) -> List[Segment]:
+    positions = {row_id: p for p, row_id in enumerate(previous)}
+    segments: List[Segment] = []
+    inserted: List[int] = []
+    i = 0
+    while i < len(current):
+        p = positions.get(current[i])
+        if p is None:
+            inserted.append(current[i])
+            i += 1
+            continue
+        if inserted:
+            segments.append({"insert": inserted})
+            inserted = []
+        length = _common_length(previous, p, current, i)
+        segments.append({"copy": [p, length]})
+        i += length
+    if inserted:
+        segments.append({"insert": inserted})
+    return segments
+
+
+def delta_size(segments: List[Segment]) -> int:
+    # number of transferred integers
+    return sum(2 if "copy" in s else len(s["insert"]) for s in segments)
+
+
+def apply_delta(previous: Sequence[int], segments: List[Segment]) -> List[int]:
+    current: List[int] = []
+    for s in segments:
+        if "copy" in s:
+            start, length = s["copy"]
+            current.extend(previous[start : start + length])
+        else:
+            current.extend(s["insert"])
+    return current
@@ -0,0 +1,179 @@
+import json
+import sys
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+JSON_MIMETYPE = "application/json"
+# framed binary sort result: uint32 header length | json header padded to 4 bytes | int32 little endian orders
+SORT_MIMETYPE = "application/vnd.lineup.sort"
+ARROW_MIMETYPE = "application/vnd.apache.arrow.stream"
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+RowBatches = Iterable[Tuple[List[str], Sequence[Sequence[Any]]]]
+
+
+def has_arrow() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+
+        return True
+    except ImportError:
+        return False
+
+
+def has_brotli() -> bool:
+    try:
+        import brotli  # noqa: F401
+
+        return True
+    except ImportError:
+        return False
+
+
+def negotiate_encoding() -> Optional[str]:
+    # content coding of the current request, brotli if available since it compresses JSON better than gzip
+    from flask import request
+
+    offered = (["br"] if has_brotli() else []) + ["gzip"]
+    return request.accept_encodings.best_match(offered)
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        import brotli
+
+        # favor speed over ratio, responses are compressed per request
+        return brotli.compress(data, quality=4)
+    import gzip
+
+    return gzip.compress(data, compresslevel=5)
+
+
+def negotiate(*mimetypes: str) -> str:
+    # picks the best matching mime type of the current request, JSON is always supported
+    from flask import request
+
+    offered = [JSON_MIMETYPE] + [m for m in mimetypes if m != ARROW_MIMETYPE or has_arrow()]
+    return request.accept_mimetypes.best_match(offered, default=JSON_MIMETYPE) or JSON_MIMETYPE
+
+
+def to_int32(values: Sequence[int]) -> bytes:
+    buffer = array("i", values)
+    if sys.byteorder == "big":
+        buffer.byteswap()
+    return buffer.tobytes()
+
+
+def encode_sort(result: Dict[str, Any]) -> bytes:
+    header = {k: v for k, v in result.items() if k != "groups"}
+    # groups sent as delta just have their edit script and length in the header, no buffer
+    header["groups"] = [dict({k: v for k, v in g.items() if k != "order"}, length=len(g["order"])) if "order" in g else g for g in result["groups"]]
+    header_bytes = json.dumps(header).encode("utf-8")
+    # pad such that the orders can be directly viewed as Int32Array
+    padding = -(4 + len(header_bytes)) % 4
+
+    chunks = [to_int32([len(header_bytes)]), header_bytes, b" " * padding]
+    chunks.extend(to_int32(g["order"]) for g in result["groups"] if "order" in g)
+    return b"".join(chunks)
+
+
+def to_arrow_schema(columns: List[str], types: Dict[str, str]) -> Any:
+    import pyarrow as pa
+
+    # by the database types instead of inferred from the values, an all null batch would otherwise become of null type
+    arrow_types = {
+        "smallint": pa.int16(),
+        "integer": pa.int32(),
+        "bigint": pa.int64(),
+        "real": pa.float32(),
+        "double precision": pa.float64(),
+        "numeric": pa.float64(),
+        "boolean": pa.bool_(),
+        "date": pa.date32(),
+        "timestamp without time zone": pa.timestamp("us"),
+        "timestamp with time zone": pa.timestamp("us", tz="UTC"),
+    }
+    return pa.schema([(c, arrow_types.get(types.get(c, ""), pa.string())) for c in columns])
+
+
+def _to_arrow_values(values: Sequence[Any], field: Any) -> Any:
+    import pyarrow as pa
+
+    if pa.types.is_floating(field.type):
+        # numeric columns are fetched as Decimal
+        values = [float(v) if v is not None else None for v in values]
+    elif pa.types.is_string(field.type):
+        values = [str(v) if v is not None else None for v in values]
+    return pa.array(list(values), type=field.type)
+
+
+def _to_record_batch(rows: Sequence[Optional[Sequence[Any]]], schema: Any):
+    import pyarrow as pa
+
+    # missing rows become all null rows
+    empty = (None,) * len(schema)
+    values = list(zip(*(row if row is not None else empty for row in rows))) or [()] * len(schema)
+    return pa.RecordBatch.from_arrays([_to_arrow_values(v, f) for v, f in zip(values, schema)], schema=schema)
+
+
+def encode_arrow(rows: Sequence[Optional[Sequence[Any]]], schema: Any) -> bytes:
+    import pyarrow as pa
+
+    sink = pa.BufferOutputStream()
+    writer = pa.ipc.new_stream(sink, schema)
+    writer.write_batch(_to_record_batch(rows, schema))
+    writer.close()
+    return sink.getvalue().to_pybytes()
+
+
+class _ChunkSink:
+    # file like object collecting the written chunks such that they can be yielded
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.closed = False
+
+    def write(self, data: Any):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def pop(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_arrow(batches: RowBatches, schema: Any) -> Iterator[bytes]:
+    import pyarrow as pa
+
+    sink = _ChunkSink()
+    # the schema is always written, an empty table is a valid stream without batches
+    writer = pa.ipc.new_stream(sink, schema)
+    yield sink.pop()
+    for _, rows in batches:
+        writer.write_batch(_to_record_batch(rows, schema))
+        yield sink.pop()
+    writer.close()
+    yield sink.pop()
+
+
+def stream_json(batches: RowBatches, ndjson: bool = False) -> Iterator[str]:
+    # flask's encoder to serialize dates the same way as regular responses
+    from flask import json as flask_json
+
+    separator = "\n" if ndjson else ","
+    first = True
+    if not ndjson:
+        yield "["
+    for columns, rows in batches:
+        chunk = separator.join(flask_json.dumps(dict(zip(columns, row))) for row in rows)
+        if not chunk:
+            continue
+        yield chunk if first else separator + chunk
+        first = False
+    yield "\n" if ndjson else "]"
@@ -37,8 +37,9 @@ BEGIN
   -- clamp bucket
   IF bucket < 0 THEN
     bucket := 0;
-  ELSE IF bucket > nbuckets THEN
-    bucket := nbuckets;
+  ELSE IF bucket >= nbuckets THEN
+    -- the maximum itself belongs to the last bucket
+    bucket := nbuckets - 1;
   END IF;
   END IF;
 
@@ -46,7 +47,7 @@ BEGIN
 
 	RETURN state;
 END;
-$$ LANGUAGE plpgsql IMMUTABLE;
+$$ LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE;
 
 -- inverse function of stats_sfunc trying to undo adding the given value
 CREATE OR REPLACE FUNCTION stats_sinvfunc(state stats_stype, val double precision, nbuckets integer, min_hist double precision, max_hist double precision)
@@ -72,8 +73,9 @@ BEGIN
   bucket := width_bucket(val, min_hist, max_hist, nbuckets) - 1;
   IF bucket < 0 THEN
     bucket := 0;
-  ELSE IF bucket > nbuckets THEN
-    bucket := nbuckets;
+  ELSE IF bucket >= nbuckets THEN
+    -- the maximum itself belongs to the last bucket
+    bucket := nbuckets - 1;
   END IF;
   END IF;
 
@@ -81,7 +83,7 @@ BEGIN
 
 	RETURN state;
 END;
-$$ LANGUAGE plpgsql IMMUTABLE;
+$$ LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE;
 
 
 CREATE OR REPLACE FUNCTION stats_ffunc(state stats_stype)
@@ -100,7 +102,7 @@ BEGIN
     'hist', state.hist
   );
 END;
-$$ LANGUAGE plpgsql IMMUTABLE;
+$$ LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE;
 
 -- merge two stats objects together
 CREATE OR REPLACE FUNCTION stats_combinefunc(a stats_stype, b stats_stype)
@@ -112,12 +114,13 @@ BEGIN
   ret.hist = intarray_merge(a.hist, b.hist);
   ret.missing = a.missing + b.missing;
   ret.count = a.count + b.count;
-  ret.min = CASE WHEN a.min < b.min THEN a ELSE b END;
-  ret.max = CASE WHEN a.max > b.max THEN a ELSE b END;
+  -- least and greatest ignore the null bounds of empty partial states
+  ret.min = least(a.min, b.min);
+  ret.max = greatest(a.max, b.max);
   ret.sum = a.sum + b.sum;
   RETURN ret;
 END;
-$$ LANGUAGE plpgsql IMMUTABLE;
+$$ LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE;
 
 -- computes numerical statistics for a given double precision column
 -- requires the number of buckets and the histogram borders (min_hist, max_hist) as input
@@ -188,7 +191,7 @@ BEGIN
     'missing', missing
   );
 END;
-$$ LANGUAGE plpgsql IMMUTABLE;
+$$ LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE;
 
 
 DROP AGGREGATE IF EXISTS boxplot (double precision);
@@ -202,6 +205,225 @@ CREATE AGGREGATE boxplot (val double precision)
     PARALLEL = SAFE
 );
 
+-- approximate boxplot based on a mergeable t-digest like quantile sketch with bounded memory
+DROP TYPE IF EXISTS boxplot_sketch_stype CASCADE;
+CREATE TYPE boxplot_sketch_stype AS (means double precision[], weights double precision[], missing integer, count integer, sum double precision, min double precision, max double precision, compression integer, max_outliers integer);
+
+-- merges neighboring centroids such that their weight stays below the limit of their quantile,
+-- small centroids remain at the tails, the number of centroids is in the order of the compression
+CREATE OR REPLACE FUNCTION boxplot_sketch_compress(state boxplot_sketch_stype)
+RETURNS boxplot_sketch_stype
+AS $$
+DECLARE
+  m double precision;
+  w double precision;
+  total double precision;
+  so_far double precision := 0;
+  cur_m double precision := NULL;
+  cur_w double precision := 0;
+  q double precision;
+  max_weight double precision;
+  new_means double precision[] := '{}';
+  new_weights double precision[] := '{}';
+BEGIN
+  total := (SELECT sum(x) FROM unnest(state.weights) AS t(x));
+
+  FOR m, w IN SELECT t.m, t.w FROM unnest(state.means, state.weights) AS t(m, w) ORDER BY t.m LOOP
+    IF cur_m IS NULL THEN
+      cur_m := m;
+      cur_w := w;
+      CONTINUE;
+    END IF;
+    q := (so_far + (cur_w + w) / 2) / total;
+    max_weight := 4 * total * q * (1 - q) / state.compression;
+    IF cur_w + w <= greatest(max_weight, 1) THEN
+      cur_m := cur_m + (m - cur_m) * w / (cur_w + w);
+      cur_w := cur_w + w;
+    ELSE
+      new_means := array_append(new_means, cur_m);
+      new_weights := array_append(new_weights, cur_w);
+      so_far := so_far + cur_w;
+      cur_m := m;
+      cur_w := w;
+    END IF;
+  END LOOP;
+
+  IF cur_m IS NOT NULL THEN
+    new_means := array_append(new_means, cur_m);
+    new_weights := array_append(new_weights, cur_w);
+  END IF;
+
+  state.means := new_means;
+  state.weights := new_weights;
+  RETURN state;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE;
+
+CREATE OR REPLACE FUNCTION boxplot_sketch_sfunc(state boxplot_sketch_stype, val double precision, compression integer, max_outliers integer)
+RETURNS boxplot_sketch_stype
+AS $$
+BEGIN
+  state.compression := compression;
+  state.max_outliers := max_outliers;
+
+  IF val IS NULL THEN
+    state.missing := state.missing + 1;
+    RETURN state;
+  END IF;
+
+  state.count := state.count + 1;
+  state.sum := state.sum + val;
+  IF state.max IS NULL OR val > state.max THEN
+    state.max := val;
+  END IF;
+  IF state.min IS NULL OR val < state.min THEN
+    state.min := val;
+  END IF;
+
+  -- buffer the values and compress once the buffer is full
+  state.means := array_append(state.means, val);
+  state.weights := array_append(state.weights, 1::double precision);
+  IF array_length(state.means, 1) > 10 * compression THEN
+    state := boxplot_sketch_compress(state);
+  END IF;
+  RETURN state;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE;
+
+CREATE OR REPLACE FUNCTION boxplot_sketch_combinefunc(a boxplot_sketch_stype, b boxplot_sketch_stype)
+RETURNS boxplot_sketch_stype
+AS $$
+DECLARE
+  ret boxplot_sketch_stype;
+BEGIN
+  ret.compression := coalesce(a.compression, b.compression);
+  ret.max_outliers := coalesce(a.max_outliers, b.max_outliers);
+  ret.missing := a.missing + b.missing;
+  ret.count := a.count + b.count;
+  ret.sum := a.sum + b.sum;
+  ret.min := least(a.min, b.min);
+  ret.max := greatest(a.max, b.max);
+  ret.means := a.means || b.means;
+  ret.weights := a.weights || b.weights;
+  IF array_length(ret.means, 1) > 10 * ret.compression THEN
+    ret := boxplot_sketch_compress(ret);
+  END IF;
+  RETURN ret;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE;
+
+-- estimates the p quantile by interpolating between the centers of the sorted centroids
+CREATE OR REPLACE FUNCTION boxplot_sketch_quantile(state boxplot_sketch_stype, p double precision)
+RETURNS double precision
+AS $$
+DECLARE
+  n integer;
+  total double precision;
+  target double precision;
+  center double precision;
+  prev_center double precision;
+  so_far double precision := 0;
+  i integer;
+BEGIN
+  n := array_length(state.means, 1);
+  total := state.count;
+  target := p * total;
+
+  prev_center := state.weights[1] / 2;
+  IF target <= prev_center THEN
+    RETURN state.min + (state.means[1] - state.min) * target / prev_center;
+  END IF;
+  so_far := state.weights[1];
+
+  FOR i IN 2..n LOOP
+    center := so_far + state.weights[i] / 2;
+    IF target <= center THEN
+      RETURN state.means[i - 1] + (state.means[i] - state.means[i - 1]) * (target - prev_center) / (center - prev_center);
+    END IF;
+    prev_center := center;
+    so_far := so_far + state.weights[i];
+  END LOOP;
+
+  IF total = prev_center THEN
+    RETURN state.max;
+  END IF;
+  RETURN state.means[n] + (state.max - state.means[n]) * (target - prev_center) / (total - prev_center);
+END;
+$$ LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE;
+
+CREATE OR REPLACE FUNCTION boxplot_sketch_ffunc(state boxplot_sketch_stype)
+RETURNS json
+AS $$
+DECLARE
+  q1 double precision;
+  median double precision;
+  q3 double precision;
+  iqr double precision;
+  min_whisker double precision;
+  max_whisker double precision;
+  lower_whisker double precision;
+  upper_whisker double precision;
+  outliers double precision[];
+BEGIN
+  IF state.count = 0 THEN
+    -- the same keys as boxplot_ffunc of an empty selection
+    RETURN json_build_object(
+      'min', null, 'q1', null, 'median', null, 'q3', null, 'max', null, 'outlier', null,
+      'whiskerLow', null, 'whiskerHigh', null, 'mean', null, 'count', 0, 'missing', state.missing, 'approximate', true
+    );
+  END IF;
+
+  state := boxplot_sketch_compress(state);
+
+  q1 := boxplot_sketch_quantile(state, 0.25);
+  median := boxplot_sketch_quantile(state, 0.5);
+  q3 := boxplot_sketch_quantile(state, 0.75);
+  iqr := q3 - q1;
+
+  min_whisker := q1 - 1.5 * iqr;
+  max_whisker := q3 + 1.5 * iqr;
+
+  -- the exact min and max are known, the centroids at the tails are mostly single values
+  lower_whisker := coalesce(min(x), q1) FROM unnest(array_append(state.means, state.min)) x WHERE x >= min_whisker AND x < q1;
+  upper_whisker := coalesce(max(x), q3) FROM unnest(array_append(state.means, state.max)) x WHERE x <= max_whisker AND x > q3;
+
+  -- just the most extreme outliers up to the given limit
+  outliers := array_agg(v ORDER BY v ASC) FROM (
+    SELECT v FROM (SELECT DISTINCT v FROM unnest(state.means || ARRAY[state.min, state.max]) AS t(v)) d
+    WHERE v < min_whisker OR v > max_whisker
+    ORDER BY abs(v - median) DESC
+    LIMIT state.max_outliers
+  ) o;
+
+  RETURN json_build_object(
+    'min', state.min,
+    'q1', q1,
+    'median', median,
+    'q3', q3,
+    'max', state.max,
+    'outlier', outliers,
+    'whiskerLow', lower_whisker,
+    'whiskerHigh', upper_whisker,
+    'mean', state.sum / state.count,
+    'count', state.count,
+    'missing', state.missing,
+    'approximate', true
+  );
+END;
+$$ LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE;
+
+-- approximate boxplot, the relative error of the quantiles is in the order of 1 / compression
+DROP AGGREGATE IF EXISTS boxplot_sketch (double precision, integer, integer);
+CREATE AGGREGATE boxplot_sketch (val double precision, compression integer, max_outliers integer)
+(
+    sfunc = boxplot_sketch_sfunc,
+    stype = boxplot_sketch_stype,
+    combinefunc = boxplot_sketch_combinefunc,
+    initcond = '({},{},0,0,0,,,,)',
+    finalfunc = boxplot_sketch_ffunc,
+    PARALLEL = SAFE
+);
+
 -- similar to numerical but for categorical data, requires a list of categories
 CREATE OR REPLACE FUNCTION cathist_sfunc(state integer[], val varchar, categories varchar[])
 RETURNS integer[]
@@ -235,7 +457,7 @@ BEGIN
   state[len] := state[len] + 1; -- count as missing
 	RETURN state;
 END;
-$$ LANGUAGE plpgsql IMMUTABLE;
+$$ LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE;
 
 CREATE OR REPLACE FUNCTION cathist_sinvfunc(state integer[], val varchar, categories varchar[])
 RETURNS integer[]
@@ -265,26 +487,32 @@ BEGIN
   state[len] := state[len] - 1; -- count as missing
 	RETURN state;
 END;
-$$ LANGUAGE plpgsql IMMUTABLE;
+$$ LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE;
 
 -- merges two integer arrays by adding them up, e.g. to combine two histograms
+-- the histograms start at index 0 and are empty if the partial aggregate did not see any row
 CREATE OR REPLACE FUNCTION intarray_merge(a integer[], b integer[])
 RETURNS integer[]
 AS $$
 DECLARE
-  len integer;
   i integer;
   ret integer[];
 BEGIN
-  len := array_length(a, 1);
+  IF a IS NULL OR cardinality(a) = 0 THEN
+    RETURN b;
+  END IF;
+  IF b IS NULL OR cardinality(b) = 0 THEN
+    RETURN a;
+  END IF;
 
-  FOR i in 1..len LOOP
+  ret := a;
+  FOR i in array_lower(a, 1)..array_upper(a, 1) LOOP
     ret[i] = a[i] + b[i];
   END LOOP;
 
   RETURN ret;
 END;
-$$ LANGUAGE plpgsql IMMUTABLE;
+$$ LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE;
 
 
 DROP AGGREGATE IF EXISTS cathist (varchar, categories varchar[]);
@@ -304,16 +532,24 @@ CREATE AGGREGATE cathist (val varchar, categories varchar[])
 DROP TYPE IF EXISTS datestats_stype CASCADE;
 CREATE TYPE datestats_stype AS (hist integer[], missing integer, count integer, min date, max date);
 
-CREATE OR REPLACE FUNCTION datestats_sfunc(state datestats_stype, val date, bucket_ends date[])
+-- index of the bucket of a date, buckets are consecutive days, months or years starting with the truncated first date
+CREATE OR REPLACE FUNCTION date_bucket(val date, granularity text, first date)
+RETURNS integer
+AS $$
+  SELECT CASE granularity
+    WHEN 'year' THEN date_part('year', val) - date_part('year', first)
+    WHEN 'month' THEN (date_part('year', val) - date_part('year', first)) * 12 + date_part('month', val) - date_part('month', first)
+    ELSE val - first
+  END::integer;
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+
+CREATE OR REPLACE FUNCTION datestats_sfunc(state datestats_stype, val date, granularity text, first date, nbuckets integer)
 RETURNS datestats_stype
 AS $$
 DECLARE
-  nbuckets integer;
-  x date;
   i integer;
 BEGIN
-  nbuckets := array_length(bucket_ends, 1) + 1;
-
   -- Init the array with the correct number of 0's so the caller doesn't see NULLs
   IF state.hist[0] IS NULL THEN
     state.hist := array_fill(0, ARRAY[nbuckets], ARRAY[0]);
@@ -333,32 +569,21 @@ BEGIN
     state.min := val;
   END IF;
 
-  i := 0;
-  FOREACH x IN ARRAY bucket_ends LOOP
-    IF val < x THEN
-      state.hist[i] := state.hist[i] + 1;
-      RETURN state;
-    END IF;
-    i := i + 1;
-  END LOOP;
-  -- add to last one
+  -- computed instead of searched, the last bucket includes the end of the range
+  i := least(greatest(date_bucket(val, granularity, first), 0), nbuckets - 1);
   state.hist[i] := state.hist[i] + 1;
 
 	RETURN state;
 END;
-$$ LANGUAGE plpgsql IMMUTABLE;
+$$ LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE;
 
 
-CREATE OR REPLACE FUNCTION datestats_sinvfunc(state datestats_stype, val date, bucket_ends date[])
+CREATE OR REPLACE FUNCTION datestats_sinvfunc(state datestats_stype, val date, granularity text, first date, nbuckets integer)
 RETURNS datestats_stype
 AS $$
 DECLARE
-  nbuckets integer;
-  x date;
   i integer;
 BEGIN
-  nbuckets := array_length(bucket_ends, 1) + 1;
-
   IF val IS NULL THEN
 		state.missing := state.missing - 1;
     RETURN state;
@@ -370,20 +595,12 @@ BEGIN
     RETURN NULL;
   END IF;
 
-  i := 0;
-  FOREACH x IN ARRAY bucket_ends LOOP
-    IF val < x THEN
-      state.hist[i] := state.hist[i] - 1;
-      RETURN state;
-    END IF;
-    i := i + 1;
-  END LOOP;
-  -- add to last one
+  i := least(greatest(date_bucket(val, granularity, first), 0), nbuckets - 1);
   state.hist[i] := state.hist[i] - 1;
 
 	RETURN state;
 END;
-$$ LANGUAGE plpgsql IMMUTABLE;
+$$ LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE;
 
 
 CREATE OR REPLACE FUNCTION datestats_ffunc(state datestats_stype)
@@ -399,7 +616,7 @@ BEGIN
     'hist', state.hist
   );
 END;
-$$ LANGUAGE plpgsql IMMUTABLE;
+$$ LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE;
 
 
 CREATE OR REPLACE FUNCTION datestats_combinefunc(a datestats_stype, b datestats_stype)
@@ -411,15 +628,16 @@ BEGIN
   ret.hist = intarray_merge(a.hist, b.hist);
   ret.missing = a.missing + b.missing;
   ret.count = a.count + b.count;
-  ret.min = CASE WHEN a.min < b.min THEN a ELSE b END;
-  ret.max = CASE WHEN a.max > b.max THEN a ELSE b END;
+  ret.min = least(a.min, b.min);
+  ret.max = greatest(a.max, b.max);
   RETURN ret;
 END;
-$$ LANGUAGE plpgsql IMMUTABLE;
+$$ LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE;
 
 
 DROP AGGREGATE IF EXISTS datestats (date, date[]);
-CREATE AGGREGATE datestats (val date, bucket_ends date[])
+DROP AGGREGATE IF EXISTS datestats (date, text, date, integer);
+CREATE AGGREGATE datestats (val date, granularity text, first date, nbuckets integer)
 (
     sfunc = datestats_sfunc,
     stype = datestats_stype,
@@ -445,6 +663,11 @@ DECLARE
   d0 double precision;
   d1 double precision;
 BEGIN
+  -- outside of the domain of the transformation, missing like in the numpy backend
+  IF (type = 'log' AND val <= 0) OR (type IN ('sqrt', 'pow1.1') AND val < 0) THEN
+    RETURN NULL;
+  END IF;
+
   CASE type
   WHEN 'log' THEN
     v := ln(val);
@@ -476,4 +699,4 @@ BEGIN
 
   RETURN normalized * (range1 - range0) + range0;
 END;
-$$ LANGUAGE plpgsql IMMUTABLE;
+$$ LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE;
@@ -0,0 +1,77 @@
+from typing import Any, Dict, List, Tuple
+
+StrDict = Dict[str, Any]
+
+NUMBER_TYPES = {"double precision", "real", "numeric", "integer", "bigint", "smallint"}
+DATE_TYPES = {"date", "timestamp without time zone", "timestamp with time zone"}
+TIMESTAMP_TYPES = {"timestamp without time zone", "timestamp with time zone"}
+TEXT_TYPES = {"text", "character varying", "character"}
+
+
+# column descriptions and data characteristics of a table at a given data version
+class Metadata:
+    def __init__(
+        self, version: int, count: int, desc: List[StrDict], categories: Dict[str, List[str]], ranges: Dict[str, Tuple[Any, Any]], types: Dict[str, str]
+    ):
+        self.version = version
+        self.count = count
+        self.desc = desc
+        # database type of every column including the id
+        self.types = types
+        self.categories = categories
+        # min and max of the number and date columns
+        self.ranges = ranges
+
+
+def load_metadata(session: Any, table: str, version: int, max_categories: int = 50) -> Metadata:
+    from sqlalchemy import text
+
+    # the label of a column is its comment, see data.sql
+    columns = session.execute(
+        text(
+            """select column_name, data_type, col_description(cast(:t as regclass), ordinal_position) as label
+        from information_schema.columns
+        where table_name = :t and table_schema = current_schema()
+        order by ordinal_position"""
+        ),
+        dict(t=table),
+    ).fetchall()
+    types = {c["column_name"]: c["data_type"] for c in columns}
+    columns = [c for c in columns if c["column_name"] != "id"]
+
+    ranged = [c for c in columns if c["data_type"] in NUMBER_TYPES or c["data_type"] in DATE_TYPES]
+    keys = ["count(*) as c"]
+    for i, c in enumerate(ranged):
+        # timestamps are binned and filtered by their date
+        value = "cast({0} as date)".format(c["column_name"]) if c["data_type"] in TIMESTAMP_TYPES else c["column_name"]
+        keys.append("min({0}) as min{1}".format(value, i))
+        keys.append("max({0}) as max{1}".format(value, i))
+    overall = session.execute("select {0} from {1}".format(", ".join(keys), table)).first()
+    ranges = {c["column_name"]: (overall["min{0}".format(i)], overall["max{0}".format(i)]) for i, c in enumerate(ranged)}
+
+    categories: Dict[str, List[str]] = {}
+    desc: List[StrDict] = []
+    for c in columns:
+        column = c["column_name"]
+        label = c["label"] or column
+        if c["data_type"] in NUMBER_TYPES:
+            low, high = ranges[column]
+            domain = [low, high] if low is not None else [0, 1]
+            if domain[0] == domain[1]:
+                # a constant column still needs a non-empty domain to be binned and normalized
+                domain = [domain[0], domain[0] + 1]
+            desc.append(dict(label=label, type="number", column=column, domain=domain))
+        elif c["data_type"] in DATE_TYPES:
+            desc.append(dict(label=label, type="date", column=column, dateFormat="%Y-%m-%d"))
+        elif c["data_type"] in TEXT_TYPES:
+            # text columns with few distinct values are categorical
+            query = "select distinct {c} as v from {t} where {c} is not null order by 1 limit :limit".format(c=column, t=table)
+            r = session.execute(text(query), dict(limit=max_categories + 1))
+            values = [row["v"] for row in r]
+            if len(values) <= max_categories:
+                categories[column] = values
+                desc.append(dict(label=label, type="categorical", column=column, categories=values))
+            else:
+                desc.append(dict(label=label, type="string", column=column))
+
+    return Metadata(version, overall["c"], desc, categories, ranges, types)
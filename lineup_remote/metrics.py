@@ -0,0 +1,174 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    labels = ['{0}="{1}"'.format(n, str(v).replace("\\", "\\\\").replace('"', '\\"')) for n, v in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Sequence[str] = (), value: float = 1):
+        key = tuple(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def render(self) -> List[str]:
+        lines = ["# HELP {0} {1}".format(self.name, self.help), "# TYPE {0} counter".format(self.name)]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append("{0}{1} {2}".format(self.name, _format_labels(self.labels, key), value))
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # cumulative bucket counts, sum and count per label combination
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Sequence[str], value: float):
+        key = tuple(labels)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-1] += 1
+            total[0] += value
+
+    def render(self) -> List[str]:
+        lines = ["# HELP {0} {1}".format(self.name, self.help), "# TYPE {0} histogram".format(self.name)]
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, counts):
+                    lines.append("{0}_bucket{1} {2}".format(self.name, _format_labels(self.labels, key, 'le="{0}"'.format(bound)), count))
+                lines.append("{0}_bucket{1} {2}".format(self.name, _format_labels(self.labels, key, 'le="+Inf"'), counts[-1]))
+                lines.append("{0}_sum{1} {2}".format(self.name, _format_labels(self.labels, key), total[0]))
+                lines.append("{0}_count{1} {2}".format(self.name, _format_labels(self.labels, key), counts[-1]))
+        return lines
+
+
+request_duration = Histogram("lineup_request_duration_seconds", "request latency per operation", ["operation"])
+phase_duration = Histogram("lineup_phase_duration_seconds", "time spent per request in each phase", ["operation", "phase"])
+rows_scanned = Counter("lineup_rows_scanned_total", "rows matching the filters of the processed queries", ["operation"])
+rows_returned = Counter("lineup_rows_returned_total", "rows or ids returned to the client", ["operation"])
+slow_queries = Counter("lineup_slow_queries_total", "queries exceeding the slow query threshold", ["operation"])
+
+REGISTRY: List[Any] = [request_duration, phase_duration, rows_scanned, rows_returned, slow_queries]
+
+
+def render() -> str:
+    # Prometheus text exposition format
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+# timings of the phases of the request handled by the current thread
+class Trace:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.operation = "unknown"
+        self.phases: Dict[str, float] = {}
+        self.handler_end: Optional[float] = None
+
+    def add(self, phase: str, elapsed: float):
+        self.phases[phase] = self.phases.get(phase, 0.0) + elapsed
+
+
+_local = threading.local()
+
+
+def start_trace() -> Trace:
+    _local.trace = Trace()
+    return _local.trace
+
+
+def current_trace() -> Optional[Trace]:
+    return getattr(_local, "trace", None)
+
+
+def finish_trace() -> Optional[Trace]:
+    trace = current_trace()
+    _local.trace = None
+    if trace is None:
+        return None
+    end = time.perf_counter()
+    if trace.handler_end is not None:
+        # converting the result to a response
+        trace.add("serialize", end - trace.handler_end)
+    request_duration.observe([trace.operation], end - trace.start)
+    for phase, elapsed in trace.phases.items():
+        phase_duration.observe([trace.operation, phase], elapsed)
+    return trace
+
+
+@contextmanager
+def span(phase: str) -> Iterator[None]:
+    # nested spans of the same thread are just counted once by their outermost phase
+    trace = current_trace()
+    if trace is None or getattr(_local, "active", False):
+        yield
+        return
+    _local.active = True
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(phase, time.perf_counter() - start)
+        _local.active = False
+
+
+def current_operation() -> str:
+    trace = current_trace()
+    return trace.operation if trace else "unknown"
+
+
+def count_rows(scanned: int = 0, returned: int = 0):
+    operation = current_operation()
+    if scanned:
+        rows_scanned.inc([operation], scanned)
+    if returned:
+        rows_returned.inc([operation], returned)
+
+
+def count_slow_query():
+    slow_queries.inc([current_operation()])
+
+
+def to_server_timing(trace: Trace) -> str:
+    # Server-Timing header, e.g. parse;dur=0.4, db;dur=12.1
+    return ", ".join("{0};dur={1:.1f}".format(phase, elapsed * 1000) for phase, elapsed in trace.phases.items())
+
+
+def instrument(function: Any, operation: str) -> Any:
+    import functools
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        trace = current_trace()
+        if trace is not None:
+            trace.operation = operation
+        try:
+            return function(*args, **kwargs)
+        finally:
+            if trace is not None:
+                trace.handler_end = time.perf_counter()
+
+    return wrapper
@@ -1,5 +1,39 @@
+import datetime
+import json
+import math
 import re
-from typing import Any, cast, Dict, Optional, Tuple
+from typing import Any, cast, Dict, List, Optional
+
+# mapping types known by map_value, see functions.sql
+MAPPING_TYPES = ("linear", "log", "sqrt", "pow1.1", "pow2", "pow3")
+
+# aggregates of the group sort methods of number columns
+GROUP_SORT_AGGREGATES = dict(
+    min="min({0})",
+    max="max({0})",
+    mean="avg({0})",
+    q1="percentile_cont(0.25) within group (order by {0})",
+    median="percentile_cont(0.5) within group (order by {0})",
+    q3="percentile_cont(0.75) within group (order by {0})",
+)
+
+# transformations of map_value
+_TRANSFORMS: Dict[str, Any] = {"log": math.log, "sqrt": math.sqrt, "pow1.1": lambda v: v ** 1.1, "pow2": lambda v: v ** 2, "pow3": lambda v: v ** 3}
+
+
+def to_number_literal(value: Any) -> str:
+    v = float(value)
+    if not math.isfinite(v):
+        raise ValueError("invalid number: {0}".format(value))
+    return repr(v)
+
+
+class QueryParams(dict):
+    # bind parameters with generated unique names, such that the statement text just depends on the shape of the query
+    def add(self, value: Any, hint: str = "p") -> str:
+        name = "{0}_{1}".format(re.sub(r"\W", "_", hint), len(self))
+        self[name] = value
+        return ":" + name
 
 
 class NumberFilter:
@@ -8,21 +42,34 @@ class NumberFilter:
         self.max = dump["max"]
         self.filter_missing = dump["filterMissing"]
 
-    def to_sql(self, column: str) -> Tuple[str, Dict[str, float]]:
-        args = {}
+    def to_sql(self, column: str, params: QueryParams) -> str:
         if self.min is not None and self.max is not None:
-            sql = "{0} between :{0}_min and :{0}_max"
-            args[column + "_min"] = self.min
-            args[column + "_max"] = self.max
+            sql = "{0} between {1} and {2}".format(column, params.add(self.min, column + "_min"), params.add(self.max, column + "_max"))
         elif self.min is not None:
-            sql = "{0} >= :{0}_min"
-            args[column + "_min"] = self.min
+            sql = "{0} >= {1}".format(column, params.add(self.min, column + "_min"))
         elif self.max is not None:
-            sql = "{0} <= :{0}_max"
-            args[column + "_max"] = self.max
+            sql = "{0} <= {1}".format(column, params.add(self.max, column + "_max"))
+        else:
+            sql = "true"
         if self.filter_missing:
-            sql = "({0} is not null AND " + sql + ")"
-        return sql.format(column), args
+            sql = "({0} is not null AND {1})".format(column, sql)
+        return sql
+
+
+class DateFilter(NumberFilter):
+    # bounds in milliseconds since epoch like in LineUp, compared as the dates including them
+    def to_sql(self, column: str, params: QueryParams) -> str:
+        dates = NumberFilter(dict(min=to_date(self.min, True), max=to_date(self.max, False), filterMissing=self.filter_missing))
+        return dates.to_sql(column, params)
+
+
+def to_date(millis: Optional[float], ceil: bool) -> Optional[datetime.date]:
+    # the first date starting at or after, or the last date starting at or before the given time
+    if millis is None:
+        return None
+    epoch = datetime.date(1970, 1, 1)
+    days = millis / 86400000
+    return epoch + datetime.timedelta(days=math.ceil(days) if ceil else math.floor(days))
 
 
 class MappingFunction:
@@ -30,9 +77,28 @@ class MappingFunction:
         self.type = dump["type"]
         self.domain = dump["domain"]
         self.range = dump["range"]
-
-    def to_query(self, column: str):
-        return "map_value({column}, '{c.type}', {c.domain[0]}, {c.domain[1]}, {c.range[0]}, {c.range[1]})".format(column=column, c=self)
+        # domains which are undefined or would divide by zero in map_value are rejected alike by both backends
+        if self.type == "log" and min(self.domain) <= 0 or self.type in ("sqrt", "pow1.1") and min(self.domain) < 0:
+            raise ValueError("invalid {0} domain: {1}".format(self.type, self.domain))
+        transform = _TRANSFORMS.get(self.type, float)
+        if transform(self.domain[0]) == transform(self.domain[1]):
+            raise ValueError("empty {0} domain: {1}".format(self.type, self.domain))
+
+    def to_query(self, column: str, params: QueryParams) -> str:
+        args = [params.add(v, "map") for v in (self.type, self.domain[0], self.domain[1], self.range[0], self.range[1])]
+        return "map_value({0}, {1})".format(column, ", ".join(args))
+
+    def to_literal(self, column: str) -> str:
+        # inlined constants instead of bind parameters, such that the same score of different requests matches an expression index
+        # unknown types are treated as linear by map_value anyhow
+        mapping_type = self.type if self.type in MAPPING_TYPES else "linear"
+        args = [to_number_literal(v) for v in (self.domain[0], self.domain[1], self.range[0], self.range[1])]
+        return "map_value({0}, '{1}', {2})".format(column, mapping_type, ", ".join(args))
+
+    def is_increasing_linear(self) -> bool:
+        # keeps the order of the raw values
+        linear = self.type == "linear" or self.type not in MAPPING_TYPES
+        return linear and (self.domain[1] - self.domain[0]) * (self.range[1] - self.range[0]) > 0
 
 
 class DateGrouper:
@@ -46,26 +112,30 @@ class CategoricalFilter:
         self.filter = dump["filter"]
         self.filter_missing = dump["filterMissing"]
 
-    def to_sql(self, column: str):
-        args = {column: self.filter}
-        sql = "{0} = any(:{0})"
+    def to_sql(self, column: str, params: QueryParams) -> str:
+        sql = "{0} = any({1})".format(column, params.add(self.filter, column))
         if self.filter_missing:
-            sql = "({0} is not null AND " + sql + ")"
-        return sql.format(column), args
+            sql = "({0} is not null AND {1})".format(column, sql)
+        return sql
 
 
 class StringFilter:
     def __init__(self, dump: str):
         self.filter = dump
 
-    def to_sql(self, column: str):
+    def to_sql(self, column: str, params: QueryParams) -> str:
         if self.filter == "__FILTER_MISSING":
-            return '({0} is not null AND {0} != ""'.format(column), {}
+            return "({0} is not null AND {0} != '')".format(column)
 
         if self.filter.startswith("REGEX:"):
-            return "{0} ~ {0}".format(column), {column: self.filter[6:]}
+            return "{0} ~ {1}".format(column, params.add(self.filter[6:], column))
+
+        return "lower({0}) = {1}".format(column, params.add(self.filter.lower(), column))
+
 
-        return "lower({0}) = {0}".format(column), {column: self.filter.lower()}
+def to_code_point_order(column: str) -> str:
+    # the numpy backend compares strings by code point, which is the byte order of UTF-8 in the C collation
+    return '{0} COLLATE "C"'.format(column)
 
 
 class ColumnDump:
@@ -76,8 +146,15 @@ class ColumnDump:
         self.type = type
         self.filter: Any = None
 
-    def to_filter(self):
-        return self.filter.to_sql(self.column) if self.filter else None
+    def to_filter(self, params: QueryParams) -> Optional[str]:
+        return self.filter.to_sql(self.column, params) if self.filter else None
+
+    def to_value(self) -> str:
+        # expression of the raw value
+        return self.column
+
+    def to_sort_expressions(self) -> List[str]:
+        return [self.column]
 
 
 class NumberColumnDump(ColumnDump):
@@ -88,21 +165,42 @@ class NumberColumnDump(ColumnDump):
         self.group_sort_method = dump["groupSortMethod"]
         self.stratify_thresholds = dump["stratifyThresholds"] if dump.get("stratifyThresholds") else None
         assert self.column is not None
-        self.mapped_column = self.map.to_query(self.column)
+
+    def to_mapped(self, params: QueryParams) -> str:
+        return self.map.to_query(self.column, params)
+
+    def to_score(self) -> str:
+        return self.map.to_literal(self.column)
+
+    def to_sort_expressions(self) -> List[str]:
+        # the raw values can use plain column indexes
+        if self.map.is_increasing_linear():
+            return [self.column]
+        return ["({0})".format(self.to_score())]
 
 
 class DateColumnDump(ColumnDump):
     def __init__(self, dump: Dict[str, Any], column: str):
         super(DateColumnDump, self).__init__(dump, column, "date")
-        self.filter = NumberFilter(dump["filter"]) if dump.get("filter") else None
+        self.filter = DateFilter(dump["filter"]) if dump.get("filter") else None
         self.grouper = DateGrouper(dump["grouper"]) if dump.get("grouper") else None
 
+    def to_filter(self, params: QueryParams) -> Optional[str]:
+        return self.filter.to_sql(self.to_value(), params) if self.filter else None
+
+    def to_value(self) -> str:
+        # timestamps are filtered and binned by their date, which is a no-op for date columns
+        return "cast({0} as date)".format(self.column)
+
 
 class CategoricalColumnDump(ColumnDump):
     def __init__(self, dump: Dict[str, Any], column: str):
         super(CategoricalColumnDump, self).__init__(dump, column, "categorical")
         self.filter = CategoricalFilter(dump["filter"]) if dump.get("filter") else None
 
+    def to_sort_expressions(self) -> List[str]:
+        return [to_code_point_order(self.column)]
+
 
 class StringColumnDump(ColumnDump):
     def __init__(self, dump: Dict[str, Any], column: str):
@@ -110,6 +208,9 @@ class StringColumnDump(ColumnDump):
         self.filter = StringFilter(dump["filter"]) if dump.get("filter") else None
         self.group_criteria = dump.get("groupCriteria")
 
+    def to_sort_expressions(self) -> List[str]:
+        return [to_code_point_order(self.column)]
+
 
 class CompositeColumnDump(ColumnDump):
     def __init__(self, dump: Dict[str, Any]):
@@ -121,12 +222,41 @@ class StackColumnDump(CompositeColumnDump):
     def __init__(self, dump: Dict[str, Any]):
         super(StackColumnDump, self).__init__(dump)
         self.total = dump["width"]
+        unsupported = [c.type for c in self.children if not isinstance(c, (NumberColumnDump, StackColumnDump))]
+        if unsupported:
+            raise ValueError("unsupported stack children: {0}".format(", ".join(unsupported)))
+        # like in LineUp the children are weighted by their share of the width
+        widths = [c.get("width", 1) for c in dump.get("children", [])]
+        self.weights = [w / sum(widths) if sum(widths) else 1 / len(widths) for w in widths]
+        # the score is already normalized
+        self.map = MappingFunction(dict(type="linear", domain=[0, 1], range=[0, 1]))
+        self.group_sort_method = dump.get("groupSortMethod", "median")
+
+    def to_score(self) -> str:
+        # weighted sum of the mapped values of the children, missing if any of them is missing
+        if not self.children:
+            return "cast(null as double precision)"
+        terms = ["{0} * {1}".format(to_number_literal(w), c.to_score()) for w, c in zip(self.weights, self.children)]
+        return "({0})".format(" + ".join(terms))
+
+    def to_value(self) -> str:
+        return self.to_score()
+
+    def to_mapped(self, params: QueryParams) -> str:
+        return self.to_score()
+
+    def to_sort_expressions(self) -> List[str]:
+        return [self.to_score()] if self.children else []
 
 
 class NestedColumnDump(CompositeColumnDump):
     def __init__(self, dump: Dict[str, Any]):
         super(NestedColumnDump, self).__init__(dump)
 
+    def to_sort_expressions(self) -> List[str]:
+        # lexicographic by the children
+        return [e for c in self.children for e in c.to_sort_expressions()]
+
 
 def parse_column_dump(dump: Dict[str, Any]):
     desc = dump["desc"]
@@ -155,6 +285,11 @@ class ComputeColumnDump:
         self.dump = dump
         self.type = type
 
+    def to_key(self) -> str:
+        # canonical representation of everything influencing the statistics of the column
+        mapping = getattr(self.dump, "map", None)
+        return json.dumps([self.type, self.dump.to_value(), vars(mapping) if mapping else None], sort_keys=True)
+
 
 def parse_compute_column_dump(dump: Dict[str, Any]):
     return ComputeColumnDump(parse_column_dump(dump["dump"]), dump["type"])
@@ -165,10 +300,19 @@ class SortCriteria:
         self.col = parse_column_dump(dump["col"])
         self.asc = dump["asc"]
 
-    def to_clause(self):
+    def to_clauses(self) -> List[str]:
         if self.asc:
-            return self.col.column
-        return self.col.column + " DESC"
+            return self.col.to_sort_expressions()
+        return [e + " DESC" for e in self.col.to_sort_expressions()]
+
+    def to_clause(self) -> str:
+        return ", ".join(self.to_clauses())
+
+    def to_group_clauses(self) -> List[str]:
+        # groups are ordered by an aggregate of their rows, number columns and stacks by their group sort method
+        method = getattr(self.col, "group_sort_method", None)
+        aggregate = GROUP_SORT_AGGREGATES.get(method, GROUP_SORT_AGGREGATES["median"]) if method else "min({0})"
+        return [aggregate.format(e) + ("" if self.asc else " DESC") for e in self.col.to_sort_expressions()]
 
 
 class ServerRankingDump:
@@ -178,32 +322,27 @@ class ServerRankingDump:
         self.group_criteria = [parse_column_dump(d) for d in dump.get("groupCriteria", [])]
         self.group_sort_criteria = [SortCriteria(d) for d in dump.get("groupSortCriteria", [])]
 
-        # TODO support nested columns, support boolean columns
-        # TODO support stacked columns
+        # TODO support boolean columns
 
-    def to_filter(self):
-        fs = [f.to_filter() for f in self.filter if f.filter]
-        args = dict()
-        for f in fs:
-            args.update(f[1])
-        return " AND ".join(f[0] for f in fs), args
+    def to_filter(self, params: QueryParams) -> str:
+        return " AND ".join(f.to_filter(params) for f in self.filter if f.filter)
 
-    def to_where(self, group: Optional[str] = None):
-        filter_sql, args = self.to_filter()
-        where = "WHERE " + filter_sql if filter_sql else ""
+    def to_where(self, params: QueryParams, group: Optional[str] = None) -> str:
+        clauses = [self.to_filter(params)]
         if group:
-            args["groupname"] = group
-            if not where:
-                where = "WHERE {0} = :groupname".format(self.to_group_name())
-            else:
-                where += " AND {0} = :groupname".format(self.to_group_name())
-        return where, args
+            clauses.append("{0} = {1}".format(self.to_group_name(), params.add(group, "groupname")))
+        where = " AND ".join(c for c in clauses if c)
+        return "WHERE " + where if where else ""
 
     def to_sort(self):
-        clauses = [c.to_clause() for c in self.sort_criteria]
-        if not clauses:
-            return ""
-        return "ORDER BY " + ", ".join(clauses)
+        # the id breaks ties, such that the order is unique like the one of the numpy backend and pages are stable
+        clauses = [clause for c in self.sort_criteria for clause in c.to_clauses()]
+        return "ORDER BY " + ", ".join(clauses + ["id"])
+
+    def to_group_sort(self, name: Optional[str] = None):
+        # the group name breaks ties like the id in to_sort, such that the groups come in the order of the numpy backend
+        clauses = [clause for c in self.group_sort_criteria for clause in c.to_group_clauses()]
+        return "ORDER BY " + ", ".join(clauses + [to_code_point_order(name or self.to_group_name())])
 
     def to_group_by(self):
         clauses = [c.column for c in self.group_criteria]
@@ -214,7 +353,21 @@ class ServerRankingDump:
     def to_group_name(self):
         if not self.group_criteria:
             return "'Default group'"
-        return "CONCAT({0})".format(", ".join("COALESCE({0}, 'Missing values')".format(g.column) for g in self.group_criteria))
+        # concatenated with || instead of CONCAT, which is not immutable and thus cannot be indexed
+        return "({0})".format(" || ".join("COALESCE({0}, 'Missing values')".format(g.column) for g in self.group_criteria))
+
+    def to_key(self) -> str:
+        # canonical representation of everything influencing the result, independent of column ids and filter order
+        filters = sorted(json.dumps([f.type, f.column, vars(f.filter)], sort_keys=True) for f in self.filter if f.filter)
+        return json.dumps(
+            dict(
+                filter=filters,
+                sort=[c.to_clause() for c in self.sort_criteria],
+                group=[g.column for g in self.group_criteria],
+                groupSort=[c for g in self.group_sort_criteria for c in g.to_group_clauses()],
+            ),
+            sort_keys=True,
+        )
 
 
 def parse_ranking_dump(dump: Dict[str, Any]):
@@ -0,0 +1,473 @@
+import datetime
+import re
+from typing import Any, Callable, cast, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .backend import Backend, StatsLayout, StrDict
+from .model import (
+    CategoricalFilter,
+    ColumnDump,
+    ComputeColumnDump,
+    DateFilter,
+    MappingFunction,
+    NestedColumnDump,
+    NumberColumnDump,
+    NumberFilter,
+    ServerRankingDump,
+    SortCriteria,
+    StackColumnDump,
+    StringFilter,
+)
+
+MISSING_GROUP = "Missing values"
+
+_TRANSFORMS: Dict[str, Callable[[Any], Any]] = {
+    "log": np.log,
+    "sqrt": np.sqrt,
+    "pow1.1": lambda v: np.power(v, 1.1),
+    "pow2": lambda v: np.power(v, 2),
+    "pow3": lambda v: np.power(v, 3),
+}
+
+
+def _to_array(values: List[Any]) -> np.ndarray:
+    sample = next((v for v in values if v is not None), None)
+    if isinstance(sample, bool) or sample is None:
+        return np.array(values, dtype=object)
+    if isinstance(sample, int) and all(v is not None for v in values):
+        return np.array(values, dtype=np.int64)
+    if isinstance(sample, (int, float)):
+        return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+    if isinstance(sample, datetime.datetime):
+        # wall clock time in the time zone of the session, which is also the date the database casts it to
+        return np.array([np.datetime64("NaT") if v is None else v.replace(tzinfo=None) for v in values], dtype="datetime64[us]")
+    if isinstance(sample, datetime.date):
+        return np.array([np.datetime64("NaT") if v is None else v for v in values], dtype="datetime64[D]")
+    return np.array(values, dtype=object)
+
+
+def _is_null(values: np.ndarray) -> np.ndarray:
+    if values.dtype.kind == "f":
+        return np.isnan(values)
+    if values.dtype.kind == "M":
+        return np.isnat(values)
+    if values.dtype.kind == "O":
+        return np.array([v is None for v in values], dtype=bool)
+    return np.zeros(len(values), dtype=bool)
+
+
+def map_value(values: np.ndarray, mapping: MappingFunction) -> np.ndarray:
+    # vectorized version of map_value in functions.sql
+    f = _TRANSFORMS.get(mapping.type, lambda v: v)
+    with np.errstate(all="ignore"):
+        d0 = f(float(mapping.domain[0]))
+        d1 = f(float(mapping.domain[1]))
+        normalized = (f(values) - d0) / (d1 - d0)
+        mapped = normalized * (mapping.range[1] - mapping.range[0]) + mapping.range[0]
+        # values outside of the domain of the transformation are missing, like -inf of log(0)
+        if mapping.type == "log":
+            return np.where(values <= 0, np.nan, mapped)
+        if mapping.type in ("sqrt", "pow1.1"):
+            return np.where(values < 0, np.nan, mapped)
+        return mapped
+
+
+def _percentile(q: float) -> Callable[[np.ndarray], float]:
+    return lambda v: np.percentile(v, q)
+
+
+# counterparts of GROUP_SORT_AGGREGATES in model.py
+_GROUP_SORT_FUNCTIONS: Dict[str, Callable[[np.ndarray], float]] = dict(
+    min=np.min, max=np.max, mean=np.mean, q1=_percentile(25), median=_percentile(50), q3=_percentile(75)
+)
+
+
+def _sort_keys(values: np.ndarray, asc: bool) -> List[np.ndarray]:
+    # lexsort keys of a single criteria, with the nulls ordering of the database
+    nulls = np.isnan(values)
+    values = np.where(nulls, 0, values)
+    if asc:
+        # NULLS LAST
+        return [values, nulls]
+    # NULLS FIRST
+    return [-values, ~nulls]
+
+
+def stats(values: np.ndarray, nbuckets: int, min_hist: float, max_hist: float) -> StrDict:
+    # counterpart of the stats aggregate in functions.sql
+    if len(values) == 0:
+        return dict(min=None, max=None, mean=None, count=0, missing=0, hist=[])
+    missing = np.isnan(values)
+    valid = values[~missing]
+    with np.errstate(all="ignore"):
+        # same as width_bucket - 1 clamped, values >= max_hist end up in the last bucket
+        buckets = np.clip(np.floor((valid - min_hist) * nbuckets / (max_hist - min_hist)), 0, nbuckets - 1).astype(np.int64)
+    hist = np.bincount(buckets, minlength=nbuckets)
+    count = len(valid)
+    return dict(
+        min=float(valid.min()) if count else None,
+        max=float(valid.max()) if count else None,
+        mean=float(valid.sum()) / count if count else None,
+        count=count,
+        missing=int(missing.sum()),
+        hist=hist.tolist(),
+    )
+
+
+def boxplot(values: np.ndarray) -> StrDict:
+    # counterpart of the boxplot aggregate in functions.sql using the same linear interpolated percentiles
+    if len(values) == 0:
+        return dict(min=None, q1=None, median=None, q3=None, max=None, outlier=None, whiskerLow=None, whiskerHigh=None, mean=None, count=None, missing=None)
+    missing = np.isnan(values)
+    valid = np.sort(values[~missing])
+    count = len(valid)
+    if count == 0:
+        return dict(min=None, q1=None, median=None, q3=None, max=None, outlier=None, whiskerLow=None, whiskerHigh=None, mean=None, count=0, missing=int(missing.sum()))
+
+    p = np.percentile(valid, [0, 25, 50, 75, 100])
+    q1, q3 = float(p[1]), float(p[3])
+    iqr = q3 - q1
+    min_whisker = q1 - 1.5 * iqr
+    max_whisker = q3 + 1.5 * iqr
+
+    lower = valid[(valid >= min_whisker) & (valid < q1)]
+    upper = valid[(valid <= max_whisker) & (valid > q3)]
+    outliers = valid[(valid < min_whisker) | (valid > max_whisker)]
+
+    return dict(
+        min=float(p[0]),
+        q1=q1,
+        median=float(p[2]),
+        q3=q3,
+        max=float(p[4]),
+        outlier=outliers.tolist() or None,
+        whiskerLow=float(lower.min()) if len(lower) else q1,
+        whiskerHigh=float(upper.max()) if len(upper) else q3,
+        mean=float(valid.mean()),
+        count=count,
+        missing=int(missing.sum()),
+    )
+
+
+def datestats(values: np.ndarray, bucket_ends: List[datetime.date]) -> StrDict:
+    # counterpart of the datestats aggregate in functions.sql
+    if len(values) == 0:
+        return dict(min=None, max=None, count=0, missing=0, hist=[])
+    missing = np.isnat(values)
+    valid = values[~missing].astype("datetime64[D]")
+    ends = np.array(bucket_ends, dtype="datetime64[D]")
+    hist = np.bincount(np.searchsorted(ends, valid, side="right"), minlength=len(ends) + 1)
+    count = len(valid)
+    return dict(
+        min=str(valid.min()) if count else None,
+        max=str(valid.max()) if count else None,
+        count=count,
+        missing=int(missing.sum()),
+        hist=hist.tolist(),
+    )
+
+
+# trigram index over the distinct values of a column, candidates are verified by a substring check
+class NGramIndex:
+    def __init__(self, values: List[str], n: int = 3):
+        self.n = n
+        self.values = values
+        self.postings: Dict[str, set] = {}
+        for i, v in enumerate(values):
+            for gram in self._grams(v):
+                self.postings.setdefault(gram, set()).add(i)
+
+    def _grams(self, value: str):
+        return {value[i : i + self.n] for i in range(len(value) - self.n + 1)}
+
+    def search(self, query: str) -> List[int]:
+        grams = self._grams(query)
+        if not grams:
+            # too short for the index
+            return [i for i, v in enumerate(self.values) if query in v]
+        candidates = set.intersection(*(self.postings.get(g, set()) for g in grams))
+        return sorted(i for i in candidates if query in self.values[i])
+
+
+# in memory columnar execution engine evaluating rankings and statistics as vectorized operations
+#
+# the table is a snapshot loaded once, string values are compared using their code point order
+# which might differ from the collation of the database
+class NumpyBackend(Backend):
+    def __init__(self, columns: Dict[str, np.ndarray], version: int = 0):
+        order = np.argsort(columns["id"], kind="stable")
+        self.columns = {k: v[order] for k, v in columns.items()}
+        self.nulls = {k: _is_null(v) for k, v in self.columns.items()}
+        self.ids = self.columns["id"]
+        self.version = version
+        self._factorized: Dict[str, Tuple[List[Any], np.ndarray]] = {}
+        self._search_indexes: Dict[str, NGramIndex] = {}
+
+    @staticmethod
+    def load(bind: Any, table: str, version: int = 0, fetch_size: int = 10000) -> "NumpyBackend":
+        with bind.connect() as connection:
+            r = connection.execution_options(stream_results=True).execute("select * from {t}".format(t=table))
+            names = list(r.keys())
+            values: List[List[Any]] = [[] for _ in names]
+            while True:
+                batch = r.fetchmany(fetch_size)
+                if not batch:
+                    break
+                for column, column_values in zip(values, zip(*batch)):
+                    column.extend(column_values)
+        return NumpyBackend({name: _to_array(v) for name, v in zip(names, values)}, version)
+
+    def _column(self, column: str) -> np.ndarray:
+        if column not in self.columns:
+            raise ValueError("unknown column: {0}".format(column))
+        return self.columns[column]
+
+    def _numeric(self, column: str, days: bool = False) -> np.ndarray:
+        values = self._column(column)
+        if values.dtype.kind == "M":
+            # dates as milliseconds since epoch like in LineUp, timestamps are truncated to their date like cast(column as date) if requested
+            if days:
+                values = values.astype("datetime64[D]")
+            return np.where(self.nulls[column], np.nan, values.astype("datetime64[ms]").astype(np.int64).astype(np.float64))
+        if values.dtype.kind == "O":
+            _, codes = self._factorize(column)
+            return np.where(codes < 0, np.nan, codes.astype(np.float64))
+        return values.astype(np.float64)
+
+    def _factorize(self, column: str) -> Tuple[List[Any], np.ndarray]:
+        # sorted unique non null values and the code of each row, -1 for missing values
+        if column in self._factorized:
+            return self._factorized[column]
+        values = self._column(column)
+        nulls = self.nulls[column]
+        valid = values[~nulls]
+        if values.dtype.kind == "O":
+            uniques = sorted(set(valid.tolist()))
+            lookup = {u: i for i, u in enumerate(uniques)}
+            codes = np.array([lookup[v] if v is not None else -1 for v in values.tolist()], dtype=np.int64)
+        else:
+            unique_values, inverse = np.unique(valid, return_inverse=True)
+            uniques = unique_values.astype(object).tolist() if values.dtype.kind == "M" else unique_values.tolist()
+            codes = np.full(len(values), -1, dtype=np.int64)
+            codes[~nulls] = inverse
+        self._factorized[column] = (uniques, codes)
+        return uniques, codes
+
+    def _to_python(self, column: str, positions: np.ndarray) -> List[Any]:
+        values = self._column(column)[positions]
+        nulls = self.nulls[column][positions].tolist()
+        py = values.astype(object).tolist() if values.dtype.kind == "M" else values.tolist()
+        return [None if n else v for v, n in zip(py, nulls)]
+
+    def _string_mask(self, column: str, f: StringFilter) -> np.ndarray:
+        uniques, codes = self._factorize(column)
+        if f.filter == "__FILTER_MISSING":
+            hit = [u != "" for u in uniques]
+        elif f.filter.startswith("REGEX:"):
+            regex = re.compile(f.filter[6:])
+            hit = [regex.search(str(u)) is not None for u in uniques]
+        else:
+            query = f.filter.lower()
+            hit = [str(u).lower() == query for u in uniques]
+        hits = np.array(hit + [False], dtype=bool)
+        return hits[codes]
+
+    def _filter_mask(self, c: ColumnDump) -> np.ndarray:
+        f = c.filter
+        if isinstance(f, NumberFilter):
+            values = self._numeric(c.column, days=isinstance(f, DateFilter))
+            mask = np.ones(len(values), dtype=bool)
+            with np.errstate(invalid="ignore"):
+                if f.min is not None:
+                    mask &= values >= f.min
+                if f.max is not None:
+                    mask &= values <= f.max
+        elif isinstance(f, CategoricalFilter):
+            uniques, codes = self._factorize(c.column)
+            selected = set(f.filter)
+            hits = np.array([u in selected for u in uniques] + [False], dtype=bool)
+            mask = hits[codes]
+        elif isinstance(f, StringFilter):
+            mask = self._string_mask(c.column, f)
+        else:
+            return np.ones(len(self.ids), dtype=bool)
+        if getattr(f, "filter_missing", False):
+            mask &= ~self.nulls[c.column]
+        return mask
+
+    def _group_codes(self, ranking: ServerRankingDump) -> Tuple[List[str], np.ndarray]:
+        # same group names as COALESCE(column, 'Missing values') || ...
+        if not ranking.group_criteria:
+            return ["Default group"], np.zeros(len(self.ids), dtype=np.int64)
+        names = [""]
+        codes = np.zeros(len(self.ids), dtype=np.int64)
+        for g in ranking.group_criteria:
+            uniques, column_codes = self._factorize(g.column)
+            labels = [str(u) for u in uniques] + [MISSING_GROUP]
+            # missing values (-1) map to the last label
+            codes = codes * len(labels) + np.where(column_codes < 0, len(labels) - 1, column_codes)
+            names = [n + l for n in names for l in labels]
+        used, inverse = np.unique(codes, return_inverse=True)
+        return [names[u] for u in used.tolist()], inverse
+
+    def _mask(self, ranking: Optional[ServerRankingDump], group: Optional[str] = None) -> np.ndarray:
+        mask = np.ones(len(self.ids), dtype=bool)
+        if ranking is None:
+            return mask
+        for f in ranking.filter:
+            if f.filter:
+                mask &= self._filter_mask(f)
+        if group:
+            names, codes = self._group_codes(ranking)
+            mask &= np.isin(codes, [i for i, n in enumerate(names) if n == group])
+        return mask
+
+    def _values(self, c: ColumnDump) -> np.ndarray:
+        # raw values, see ColumnDump.to_value
+        if isinstance(c, StackColumnDump):
+            return self._score(c)
+        return self._numeric(c.column)
+
+    def _score(self, c: ColumnDump) -> np.ndarray:
+        # see to_score of number columns and stacks
+        if isinstance(c, StackColumnDump):
+            if not c.children:
+                return np.full(len(self.ids), np.nan)
+            return cast(np.ndarray, sum(w * self._score(child) for w, child in zip(c.weights, c.children)))
+        return map_value(self._numeric(c.column), cast(NumberColumnDump, c).map)
+
+    def _sort_values(self, c: ColumnDump) -> List[np.ndarray]:
+        # see ColumnDump.to_sort_expressions
+        if isinstance(c, NestedColumnDump):
+            return [v for child in c.children for v in self._sort_values(child)]
+        if isinstance(c, StackColumnDump):
+            return [self._score(c)] if c.children else []
+        if isinstance(c, NumberColumnDump) and not c.map.is_increasing_linear():
+            return [self._score(c)]
+        return [self._numeric(c.column)]
+
+    def _order(self, ranking: ServerRankingDump, positions: np.ndarray) -> np.ndarray:
+        # lexsort uses the last key as primary one, the id is the final tie breaker
+        keys = [self.ids[positions]]
+        for criteria in reversed(ranking.sort_criteria):
+            for values in reversed(self._sort_values(criteria.col)):
+                keys.extend(_sort_keys(values[positions], criteria.asc))
+        return positions[np.lexsort(keys)]
+
+    def _group_order(self, criteria: List[SortCriteria], groups: List[np.ndarray]) -> List[int]:
+        # see SortCriteria.to_group_clauses, ties keep the order of the group names
+        keys = [np.arange(len(groups))]
+        for c in reversed(criteria):
+            method = getattr(c.col, "group_sort_method", None)
+            aggregate = _GROUP_SORT_FUNCTIONS.get(method, _GROUP_SORT_FUNCTIONS["median"]) if method else np.min
+            for values in reversed(self._sort_values(c.col)):
+                group_values = []
+                for positions in groups:
+                    valid = values[positions]
+                    valid = valid[~np.isnan(valid)]
+                    group_values.append(float(aggregate(valid)) if len(valid) else np.nan)
+                keys.extend(_sort_keys(np.array(group_values, dtype=np.float64), c.asc))
+        return np.lexsort(keys).tolist()
+
+    def rows(self, ids: List[int], columns: List[str]) -> List[Optional[Sequence[Any]]]:
+        lookup = np.array(ids, dtype=np.int64)
+        positions = np.clip(np.searchsorted(self.ids, lookup), 0, max(len(self.ids) - 1, 0))
+        found = (self.ids[positions] == lookup).tolist() if len(self.ids) else [False] * len(ids)
+        values = list(zip(*[self._to_python(c, positions) for c in columns]))
+        return [row if hit else None for row, hit in zip(values, found)]
+
+    def iter_rows(self, columns: List[str], batch_size: int) -> Iterator[Tuple[List[str], List[Sequence[Any]]]]:
+        for start in range(0, len(self.ids), batch_size):
+            positions = np.arange(start, min(start + batch_size, len(self.ids)))
+            yield columns, list(zip(*[self._to_python(c, positions) for c in columns]))
+
+    def sort(self, ranking: ServerRankingDump, offset: int = 0, limit: Optional[int] = None) -> StrDict:
+        mask = self._mask(ranking)
+        order = self._order(ranking, np.flatnonzero(mask))
+
+        if not ranking.group_criteria:
+            groups = [("Default group", order)]
+        else:
+            names, codes = self._group_codes(ranking)
+            # stable partition keeps the sort order within the groups
+            order_codes = codes[order]
+            partitioned = order[np.argsort(order_codes, kind="stable")]
+            counts = np.bincount(order_codes, minlength=len(names))
+            bounds = np.concatenate([[0], np.cumsum(counts)])
+            groups = [(name, partitioned[bounds[i] : bounds[i + 1]]) for i, name in enumerate(names) if counts[i] > 0]
+            # python compares strings by code point like the C collation of ServerRankingDump.to_group_sort
+            groups.sort(key=lambda g: g[0])
+            if ranking.group_sort_criteria:
+                groups = [groups[i] for i in self._group_order(ranking.group_sort_criteria, [positions for _, positions in groups])]
+
+        window = bool(offset) or limit is not None
+        end = None if limit is None else offset + limit
+        result_groups = []
+        for name, positions in groups:
+            group: StrDict = {"name": name, "color": "gray", "order": self.ids[positions[offset:end] if window else positions].tolist()}
+            if window:
+                group["total"] = len(positions)
+            result_groups.append(group)
+
+        result: StrDict = {"groups": result_groups, "maxDataIndex": int(self.ids[mask].max()) if mask.any() else -1}
+        if window:
+            result["total"] = int(mask.sum())
+            result["offset"] = offset
+        return result
+
+    def _aggregate(self, cols: List[ComputeColumnDump], layout: StatsLayout, mask: np.ndarray) -> StrDict:
+        r: StrDict = {}
+        for i, col in enumerate(cols):
+            c = col.dump
+            if col.type in ("number", "boxplot"):
+                nc = cast(NumberColumnDump, c)
+                values = self._values(c)[mask]
+                mapped = map_value(values, nc.map)
+                if col.type == "number":
+                    r["stats{0}".format(i)] = stats(values, layout.bins, nc.map.domain[0], nc.map.domain[1])
+                    r["nstats{0}".format(i)] = stats(mapped, layout.bins, 0, 1)
+                else:
+                    r["boxplot{0}".format(i)] = boxplot(values)
+                    r["nboxplot{0}".format(i)] = boxplot(mapped)
+            elif col.type == "categorical":
+                if not mask.any():
+                    r["cathist{0}".format(i)] = []
+                    continue
+                categories = layout.categories[i]
+                uniques, codes = self._factorize(c.column)
+                # unknown and missing values are counted in the last bin
+                lookup = np.array([categories.index(u) if u in categories else len(categories) for u in uniques] + [len(categories)], dtype=np.int64)
+                r["cathist{0}".format(i)] = np.bincount(lookup[codes[mask]], minlength=len(categories) + 1).tolist()
+            elif col.type == "date":
+                _, buckets = layout.date_buckets[i]
+                r["dstats{0}".format(i)] = datestats(self._column(c.column)[mask], buckets[1:-1])
+        return r
+
+    def aggregate(self, cols: List[ComputeColumnDump], layout: StatsLayout, ranking: Optional[ServerRankingDump] = None, group: Optional[str] = None) -> StrDict:
+        return self._aggregate(cols, layout, self._mask(ranking, group))
+
+    def aggregate_groups(self, cols: List[ComputeColumnDump], layout: StatsLayout, ranking: ServerRankingDump) -> List[Tuple[str, StrDict]]:
+        mask = self._mask(ranking)
+        names, codes = self._group_codes(ranking)
+        present = np.unique(codes[mask]).tolist()
+        return [(names[g], self._aggregate(cols, layout, mask & (codes == g))) for g in present]
+
+    def search(self, column: str, query: str, limit: int) -> List[int]:
+        uniques, codes = self._factorize(column)
+        if column not in self._search_indexes:
+            self._search_indexes[column] = NGramIndex([str(u) for u in uniques])
+        index = self._search_indexes[column]
+        hits = index.search(query)
+        if not hits:
+            return []
+        # same ranking as in SQL: position of the match, length of the value, id
+        position = np.full(len(uniques) + 1, -1, dtype=np.int64)
+        length = np.zeros(len(uniques) + 1, dtype=np.int64)
+        for i in hits:
+            position[i] = index.values[i].find(query)
+            length[i] = len(index.values[i])
+        matches = np.flatnonzero(position[codes] >= 0)
+        matched_codes = codes[matches]
+        order = np.lexsort([self.ids[matches], length[matched_codes], position[matched_codes]])
+        return self.ids[matches[order[:limit]]].tolist()
@@ -0,0 +1,127 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+# thread safe LRU cache of whole rows as plain tuples bounded by the number of rows,
+# like the ResultCache all rows are bound to a data version and dropped as soon as a newer one is seen
+class RowCache:
+    def __init__(self, max_rows: int = 100000, prefetch: int = 0):
+        self.max_rows = max_rows
+        # number of rows following the last requested ones in the last sort order to load in the background
+        self.prefetch = prefetch
+        self.version: Optional[int] = None
+        self.columns: List[str] = []
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.prefetched = 0
+        self._rows: "OrderedDict[int, Tuple[Any, ...]]" = OrderedDict()
+        # compact copy of the last sort order and the position of every id in it, see set_order
+        self._order = np.empty(0, dtype=np.int64)
+        self._sorted_ids = np.empty(0, dtype=np.int64)
+        self._positions = np.empty(0, dtype=np.int64)
+        self._order_key: Optional[str] = None
+        self._order_version: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_rows > 0
+
+    def _check_version(self, version: int, columns: List[str]) -> bool:
+        # rows of older versions are ignored, a newer version replaces all rows
+        if self.version == version and self.columns == columns:
+            return True
+        if self.version is not None and version < self.version:
+            return False
+        if self._rows:
+            self.invalidations += 1
+        self._rows.clear()
+        self.version = version
+        self.columns = list(columns)
+        return True
+
+    def get(self, ids: Sequence[int], version: int, columns: List[str]) -> Dict[int, Tuple[Any, ...]]:
+        with self._lock:
+            found: Dict[int, Tuple[Any, ...]] = {}
+            if not self._check_version(version, columns):
+                self.misses += len(ids)
+                return found
+            for i in ids:
+                row = self._rows.get(i)
+                if row is not None:
+                    self._rows.move_to_end(i)
+                    found[i] = row
+            self.hits += len(found)
+            self.misses += len(ids) - len(found)
+            return found
+
+    def put(self, rows: Sequence[Optional[Tuple[Any, ...]]], version: int, columns: List[str], prefetched: bool = False):
+        if not self.enabled:
+            return
+        with self._lock:
+            if not self._check_version(version, columns):
+                return
+            for row in rows:
+                # missing rows are not cached
+                if row is None:
+                    continue
+                self._rows[row[0]] = tuple(row)
+                self._rows.move_to_end(row[0])
+                if prefetched:
+                    self.prefetched += 1
+            while len(self._rows) > self.max_rows:
+                self._rows.popitem(last=False)
+                self.evictions += 1
+
+    def has_order(self, key: str, version: int) -> bool:
+        with self._lock:
+            return self._order_key == key and self._order_version == version
+
+    def set_order(self, orders: List[List[int]], version: int, key: Optional[str] = None):
+        # orders of the groups in their displayed sequence, the key identifies the sort request
+        order = np.array([i for group_order in orders for i in group_order], dtype=np.int64)
+        # the ids sorted along with their positions to look up the position of an id by a binary search
+        positions = np.argsort(order, kind="stable")
+        sorted_ids = order[positions]
+        with self._lock:
+            self._order = order
+            self._sorted_ids = sorted_ids
+            self._positions = positions
+            self._order_key = key
+            self._order_version = version
+
+    def next_ids(self, ids: Sequence[int], version: int) -> List[int]:
+        # ids following the requested ones in the last sort order, which are not yet cached
+        # without ids the first rows of the order
+        with self._lock:
+            if not self.prefetch or self._order_version != version:
+                return []
+            position = -1
+            if ids:
+                i = int(np.searchsorted(self._sorted_ids, ids[-1]))
+                if i >= len(self._sorted_ids) or self._sorted_ids[i] != ids[-1]:
+                    return []
+                position = int(self._positions[i])
+            following = self._order[position + 1 : position + 1 + self.prefetch].tolist()
+            return [i for i in following if i not in self._rows]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return dict(
+                rows=len(self._rows),
+                maxRows=self.max_rows,
+                prefetch=self.prefetch,
+                version=self.version,
+                hits=self.hits,
+                misses=self.misses,
+                hitRate=self.hits / total if total else None,
+                prefetched=self.prefetched,
+                evictions=self.evictions,
+                invalidations=self.invalidations,
+            )
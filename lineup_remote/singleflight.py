@@ -0,0 +1,80 @@
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+# coalesces concurrent calls with the same key: the first caller executes the function,
+# the others wait for it and receive the same result (or exception) instead of running it again
+class SingleFlight:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.executions = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], T], on_wait: Optional[Callable[[], Any]] = None) -> T:
+        if not self.enabled:
+            return fn()
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.executions += 1
+            else:
+                self.coalesced += 1
+                self.waiting += 1
+                self.max_waiting = max(self.max_waiting, self.waiting)
+
+        if not leader:
+            if on_wait is not None:
+                # e.g. release resources the leader might need
+                on_wait()
+            call.done.wait()
+            with self._lock:
+                self.waiting -= 1
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            with self._lock:
+                self.errors += 1
+            raise
+        finally:
+            # later calls start a new execution, e.g. after the data changed
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.executions + self.coalesced
+            return dict(
+                enabled=self.enabled,
+                inFlight=len(self._calls),
+                waiting=self.waiting,
+                maxWaiting=self.max_waiting,
+                executions=self.executions,
+                coalesced=self.coalesced,
+                coalescedRate=self.coalesced / total if total else None,
+                errors=self.errors,
+            )
@@ -0,0 +1,91 @@
+import json
+import threading
+from typing import Any, Dict, List
+
+StrDict = Dict[str, Any]
+
+
+# unfiltered per column aggregates persisted in the stats_summary table (see data.sql),
+# an entry is valid as long as its generation matches the data version of the table
+class SummaryStore:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        # entries of the current version, to answer repeated requests without a round trip
+        self.version: int = -1
+        self._memo: Dict[str, StrDict] = {}
+        self._lock = threading.Lock()
+
+    def ensure(self, session: Any):
+        from sqlalchemy import text
+
+        session.execute(
+            text(
+                """CREATE TABLE IF NOT EXISTS stats_summary
+                (table_name text NOT NULL, column_key text NOT NULL, generation bigint NOT NULL, stats jsonb NOT NULL,
+                CONSTRAINT stats_summary_pkey PRIMARY KEY (table_name, column_key))"""
+            )
+        )
+
+    def get(self, session: Any, table: str, keys: List[str], version: int) -> Dict[str, StrDict]:
+        from sqlalchemy import text
+
+        with self._lock:
+            if self.version != version:
+                self.version = version
+                self._memo.clear()
+            found = {k: self._memo[k] for k in keys if k in self._memo}
+
+        missing = [k for k in keys if k not in found]
+        if missing:
+            r = session.execute(
+                text("select column_key, stats from stats_summary where table_name = :t and generation = :version and column_key = any(:keys)"),
+                dict(t=table, version=version, keys=missing),
+            )
+            stored = {row["column_key"]: row["stats"] for row in r}
+            found.update(stored)
+            self._remember(version, stored)
+
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put(self, session: Any, table: str, entries: Dict[str, StrDict], version: int):
+        from sqlalchemy import text
+
+        # never replace a summary of a newer version
+        for key, stats in entries.items():
+            session.execute(
+                text(
+                    """insert into stats_summary(table_name, column_key, generation, stats) values (:t, :key, :version, cast(:stats as jsonb))
+                    on conflict (table_name, column_key) do update set generation = excluded.generation, stats = excluded.stats
+                    where stats_summary.generation <= excluded.generation"""
+                ),
+                dict(t=table, key=key, version=version, stats=json.dumps(stats)),
+            )
+        session.commit()
+        self._remember(version, entries)
+        with self._lock:
+            self.refreshes += len(entries)
+
+    def _remember(self, version: int, entries: Dict[str, StrDict]):
+        with self._lock:
+            if self.version == version:
+                self._memo.update(entries)
+
+    def stats(self) -> StrDict:
+        with self._lock:
+            total = self.hits + self.misses
+            return dict(
+                enabled=self.enabled,
+                version=self.version,
+                entries=len(self._memo),
+                hits=self.hits,
+                misses=self.misses,
+                hitRate=self.hits / total if total else None,
+                refreshes=self.refreshes,
+            )
+
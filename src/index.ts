@@ -1,6 +1,10 @@
 import 'file-loader?name=index.html!extract-loader!html-loader?interpolate!./index.html';
 import './style.scss';
 import {LineUp, RemoteDataProvider, IServerData, IOrderedGroup, IRemoteStatistics, IColumnDump, IServerRankingDump, IComputeColumn} from 'lineupjs';
+import {Table} from 'apache-arrow';
+
+const SORT_MIMETYPE = 'application/vnd.lineup.sort';
+const ARROW_MIMETYPE = 'application/vnd.apache.arrow.stream';
 
 interface IRow {
   d: string;
@@ -13,34 +17,151 @@ function toColumn(desc: IColumnDump) {
   return desc.desc.split('@')[1];
 }
 
+interface IDeltaSegment {
+  copy?: [number, number];
+  insert?: number[];
+}
+
+interface ISortResult {
+  groups: (IOrderedGroup & {delta?: IDeltaSegment[]; length?: number})[];
+  maxDataIndex: number;
+  token?: string;
+  since?: string;
+}
+
+/**
+ * decodes the framed binary sort result: uint32 header length, JSON header, padding, int32 orders
+ * groups sent as delta just have their edit script in the header and no order buffer
+ */
+function decodeSort(buffer: ArrayBuffer): ISortResult {
+  const headerLength = new DataView(buffer).getUint32(0, true);
+  const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 4, headerLength)));
+  let offset = Math.ceil((4 + headerLength) / 4) * 4;
+  const groups = header.groups.map((group: {name: string; color: string; length: number; delta?: IDeltaSegment[]}) => {
+    if (group.delta) {
+      return group;
+    }
+    const order = new Int32Array(buffer, offset, group.length);
+    offset += group.length * 4;
+    return Object.assign(group, {order});
+  });
+  return Object.assign(header, {groups});
+}
+
+/**
+ * rebuilds an order from the order of the same group in the previous result and the edit script of the server
+ */
+function applyDelta(previous: ArrayLike<number>, delta: IDeltaSegment[], length: number): number[] {
+  const order = new Array<number>(length);
+  let i = 0;
+  for (const segment of delta) {
+    if (segment.copy) {
+      const [start, count] = segment.copy;
+      for (let j = start; j < start + count; ++j) {
+        order[i++] = previous[j];
+      }
+    } else {
+      for (const id of segment.insert!) {
+        order[i++] = id;
+      }
+    }
+  }
+  return order;
+}
+
+function decodeRows(buffer: ArrayBuffer): IRow[] {
+  const table = Table.from(new Uint8Array(buffer));
+  return Array.from(table, (row) => <IRow>row!.toJSON());
+}
+
+interface IGroupStatistics {
+  name: string;
+  stats: IRemoteStatistics[];
+}
+
 class Server implements IServerData {
-  constructor(public readonly totalNumberOfRows: number) {
+  private groupStats: {key: string, lookup: Promise<Map<string, IRemoteStatistics[]>>} | null = null;
+  /**
+   * recent sort results by token, the server sends the orders of the next one as deltas to the last one
+   */
+  private readonly sorts = new Map<string, ISortResult>();
+  private lastToken: string | null = null;
+
+  /**
+   * @param totalNumberOfRows number of rows
+   * @param binary whether to request binary encoded sort results and row batches
+   */
+  constructor(public readonly totalNumberOfRows: number, private readonly binary = false) {
 
   }
 
   private post(url: string, body: object) {
+    return this.postRaw(url, body).then((r) => r.json());
+  }
+
+  private postRaw(url: string, body: object, accept = 'application/json') {
     return fetch(url, {
       method: 'POST',
       body: JSON.stringify(body, null, 2),
       headers: {
-        'Content-Type': 'application/json'
+        'Content-Type': 'application/json',
+        'Accept': accept
       }
-    }).then((r) => r.json());
+    });
+  }
+
+  private requestSort(ranking: IServerRankingDump, since: string | null): Promise<ISortResult> {
+    const url = `/api/ranking/sort${since ? `?since=${encodeURIComponent(since)}` : ''}`;
+    if (this.binary) {
+      return this.postRaw(url, ranking, SORT_MIMETYPE).then((r) => r.headers.get('Content-Type') === SORT_MIMETYPE ? r.arrayBuffer().then(decodeSort) : r.json());
+    }
+    return this.post(url, ranking);
   }
 
   sort(ranking: IServerRankingDump): Promise<{groups: IOrderedGroup[]; maxDataIndex: number;}> {
-    // fix indices to typed array
-    return this.post(`/api/ranking/sort`, ranking);
+    return this.requestSort(ranking, this.lastToken).then((result) => {
+      // concurrent requests of several rankings may refer to an older result, which might be evicted in the meantime
+      const base = result.since ? this.sorts.get(result.since) : undefined;
+      const previous = new Map(base ? base.groups.map((g) => <[string, ArrayLike<number>]>[g.name, g.order]) : []);
+      if (result.groups.some((group) => group.delta && !previous.has(group.name))) {
+        return this.requestSort(ranking, null);
+      }
+      result.groups.forEach((group) => {
+        if (group.delta) {
+          group.order = applyDelta(previous.get(group.name)!, group.delta, group.length!);
+          delete group.delta;
+        }
+      });
+      return result;
+    }).then((result) => {
+      if (result.token) {
+        this.sorts.delete(result.token);
+        this.sorts.set(result.token, result);
+        if (this.sorts.size > 4) {
+          this.sorts.delete(this.sorts.keys().next().value);
+        }
+        this.lastToken = result.token;
+      }
+      return result;
+    });
+  }
+
+  private rows(r: Response): Promise<IRow[]> {
+    if (r.headers.get('Content-Type') === ARROW_MIMETYPE) {
+      return r.arrayBuffer().then(decodeRows);
+    }
+    return r.json();
   }
 
   view(indices: number[]): Promise<IRow[]> {
     if (indices.length === 1) {
       return fetch(`/api/row/${encodeURIComponent(indices[0].toString())}`).then((r) => r.json()).then((r) => [r]);
     }
+    const accept = this.binary ? ARROW_MIMETYPE : 'application/json';
     if (indices.length > 100) {
-      return this.post(`/api/row/`, indices);
+      return this.postRaw(`/api/row/`, indices, accept).then((r) => this.rows(r));
     }
-    return fetch(`/api/row/?ids=${encodeURIComponent(indices.join(','))}`).then((r) => r.json());
+    return fetch(`/api/row/?ids=${encodeURIComponent(indices.join(','))}`, {headers: {'Accept': accept}}).then((r) => this.rows(r));
   }
 
   mappingSample(column: IColumnDump): Promise<number[]> {
@@ -60,7 +181,18 @@ class Server implements IServerData {
   }
 
   computeGroupStats(ranking: IServerRankingDump, group: string, columns: IComputeColumn[]): Promise<IRemoteStatistics[]> {
-    return this.post(`/api/ranking/group/${group}/stats`, {ranking, columns});
+    // compute the stats of all groups at once and share the result among the per group requests
+    const key = JSON.stringify({ranking, columns});
+    if (!this.groupStats || this.groupStats.key !== key) {
+      const lookup = this.post(`/api/ranking/groups/stats`, {ranking, columns}).then((groups: IGroupStatistics[]) => new Map(groups.map((g) => <[string, IRemoteStatistics[]]>[g.name, g.stats])));
+      this.groupStats = {key, lookup};
+    }
+    return this.groupStats.lookup.then((lookup) => {
+      if (lookup.has(group)) {
+        return lookup.get(group)!;
+      }
+      return this.post(`/api/ranking/group/${encodeURIComponent(group)}/stats`, {ranking, columns});
+    });
   }
 }
 
@@ -69,7 +201,7 @@ Promise.all([
   fetch('/api/desc').then((r) => r.json()),
   fetch('/api/count').then((r) => r.json())
 ]).then(([desc, count]: [any[], number]) => {
-  const provider = new RemoteDataProvider(new Server(count), desc, {});
+  const provider = new RemoteDataProvider(new Server(count, new URLSearchParams(location.search).has('binary')), desc, {});
   provider.deriveDefault();
 
   return new LineUp(document.body, provider, {});
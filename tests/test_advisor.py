@@ -0,0 +1,38 @@
+from lineup_remote.advisor import IndexAdvisor, IndexCandidate
+
+COLUMNS = ["a", "b"]
+
+
+def candidate(weight: float) -> IndexCandidate:
+    # like the stack scores with a dragged weight, each one is a distinct expression
+    return IndexCandidate("rows", ("a * {0} + b".format(weight), "id"), COLUMNS)
+
+
+def test_the_least_used_candidate_makes_room():
+    advisor = IndexAdvisor("rows", 0, max_candidates=3)
+    for i in range(3):
+        advisor.record([candidate(i)] * (i + 1), 0.1)
+    indexed = advisor._candidates[candidate(0).name]
+    indexed.indexed = True
+
+    advisor.record([candidate(10)], 0.1)
+    names = set(advisor._candidates)
+    assert len(names) == 3
+    # the index is kept although it is used least, the next least used candidate is evicted
+    assert candidate(0).name in names and candidate(1).name not in names and candidate(10).name in names
+
+
+def test_unused_candidates_fade_out():
+    advisor = IndexAdvisor("rows", 0)
+    advisor.record([candidate(1)] * 8, 0.1)
+    advisor.record([candidate(2)] * 3, 0.1)
+    advisor.record([candidate(3)], 0.1)
+    rejected = advisor._candidates[candidate(3).name]
+    rejected.rejected = True
+
+    advisor._fade()
+    assert set(advisor._candidates) == {candidate(1).name, candidate(2).name, candidate(3).name}
+    advisor._fade()
+    # the rejected one is remembered such that it is not built again
+    assert set(advisor._candidates) == {candidate(1).name, candidate(3).name}
+    assert advisor._candidates[candidate(1).name].uses == 2
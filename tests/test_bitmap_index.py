@@ -0,0 +1,128 @@
+import datetime
+import math
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pytest
+
+from lineup_remote.backend import StatsLayout
+from lineup_remote.bitmap_index import BitmapIndex
+from lineup_remote.model import ComputeColumnDump, parse_column_dump, ServerRankingDump
+from lineup_remote.numpy_backend import _to_array, NumpyBackend
+
+BINS = 5
+CATEGORIES = ["c1", "c2"]
+# every bucket end is the first day of the next bucket
+BUCKETS = [datetime.date(2026, 1, 1), datetime.date(2026, 2, 1), datetime.date(2026, 3, 1), datetime.date(2026, 4, 1)]
+
+# values right at the bin edges 0.2, 0.4 and 0.6, missing and unknown values
+A = [0.0, 0.1, 0.2, 0.2, 0.3, 0.4, 0.45, 0.6, 0.6, 0.8, 1.0, None, 0.39, None, 0.59, 0.21]
+CAT = ["c1", "c2", "c1", None, "c2", "c1", "c3", "c2", "c1", "c2", None, "c1", "c2", "c1", "c1", "c2"]
+CAT2 = ["a1", "a2"] * 8
+DD = [datetime.date(2026, 1, 1) + datetime.timedelta(days=9 * i) for i in range(14)] + [None, datetime.date(2026, 2, 1)]
+
+NUMBER = {"id": "a", "desc": "number@a", "map": {"type": "linear", "domain": [0, 1], "range": [0, 1]}, "groupSortMethod": "median"}
+CATEGORICAL = {"id": "c", "desc": "categorical@cat"}
+DATE = {"id": "x", "desc": "date@dd"}
+COLS = [ComputeColumnDump(parse_column_dump(NUMBER), "number"), ComputeColumnDump(parse_column_dump(CATEGORICAL), "categorical")]
+COLS.append(ComputeColumnDump(parse_column_dump(DATE), "date"))
+LAYOUT = StatsLayout(BINS, {2: ("month", BUCKETS)}, {1: CATEGORIES})
+
+
+def to_millis(day: datetime.date) -> int:
+    return int(datetime.datetime(day.year, day.month, day.day, tzinfo=datetime.timezone.utc).timestamp() * 1000)
+
+
+def number(low: Optional[float], high: Optional[float], missing: bool = False) -> Dict[str, Any]:
+    return dict(NUMBER, filter={"min": low, "max": high, "filterMissing": missing})
+
+
+def date(low: Optional[int], high: Optional[int]) -> Dict[str, Any]:
+    return dict(DATE, filter={"min": low, "max": high, "filterMissing": True})
+
+
+@pytest.fixture(scope="module")
+def frame():
+    ids = np.arange(len(A), dtype=np.int64)
+    backend = NumpyBackend(dict(id=ids, a=_to_array(A), cat=_to_array(CAT), cat2=_to_array(CAT2), dd=_to_array(DD)))
+    index = BitmapIndex(ids)
+    index.add_number("a", np.array([np.nan if v is None else v for v in A], dtype=np.float64), BINS, [0, 1])
+    index.add_categorical("cat", CAT, CATEGORIES)
+    index.add_date("dd", _to_array(DD).astype("datetime64[D]"), BUCKETS[1:-1])
+    return backend, index
+
+
+def scalars(backend: NumpyBackend, mask: np.ndarray) -> Dict[str, Any]:
+    # what the to_scalar_keys aggregates return in the database
+    a = backend.columns["a"][mask].astype(np.float64)
+    a = a[~np.isnan(a)]
+    dd = backend.columns["dd"][mask]
+    dd = dd[~np.isnat(dd)].astype("datetime64[D]")
+    return dict(
+        min0=a.min() if len(a) else None,
+        max0=a.max() if len(a) else None,
+        count0=len(a),
+        sum0=a.sum() if len(a) else None,
+        min2=dd.min().item() if len(dd) else None,
+        max2=dd.max().item() if len(dd) else None,
+        count2=len(dd),
+    )
+
+
+def assert_same(a: Any, b: Any, path: str = ""):
+    if isinstance(a, float) or isinstance(b, float):
+        assert a is not None and b is not None and math.isclose(a, b, abs_tol=1e-12), path
+    elif isinstance(a, dict) and isinstance(b, dict):
+        assert set(a) == set(b), path
+        for k in a:
+            assert_same(a[k], b[k], path + "." + k)
+    elif isinstance(a, list) and isinstance(b, list):
+        assert len(a) == len(b), path
+        for i, (x, y) in enumerate(zip(a, b)):
+            assert_same(x, y, "{0}[{1}]".format(path, i))
+    else:
+        assert a == b, path
+
+
+@pytest.mark.parametrize(
+    "filters",
+    [
+        [],
+        # whole bins, the bounds are the smallest and largest values of their bins
+        [number(0.2, 0.59)],
+        # a bound within a bin is left to the database
+        [number(0.25, 0.6)],
+        [number(None, None, True)],
+        [number(0.2, None)],
+        [dict(CATEGORICAL, filter={"filter": ["c1"], "filterMissing": True})],
+        [dict(CATEGORICAL, filter={"filter": ["c3"], "filterMissing": True})],
+        # whole buckets, times are rounded to the days within the range
+        [date(to_millis(BUCKETS[1]) - 3600000, None)],
+        [date(to_millis(BUCKETS[1]) + 3600000, None)],
+        [date(to_millis(datetime.date(2026, 1, 10)), to_millis(BUCKETS[2]))],
+        [number(0.2, 0.59), dict(CATEGORICAL, filter={"filter": ["c2"], "filterMissing": True})],
+        [number(2, 3)],
+    ],
+)
+@pytest.mark.parametrize("group", [None, "a1"])
+def test_aggregate_matches_the_numpy_backend(frame, filters: List[Dict[str, Any]], group: Optional[str]):
+    backend, index = frame
+    ranking = ServerRankingDump(dict(filter=filters, sortCriteria=[], groupCriteria=[dict(id="c2", desc="categorical@cat2")] if group else []))
+    mask = backend._mask(ranking, group)
+
+    # see api.indexed_stats, the database matches the rows of the other filters and the group
+    bits, remaining = index.filter(ranking.filter)
+    if remaining or group:
+        bits = index.to_bitmap(backend.ids[mask].tolist())
+    else:
+        assert index.count(bits) == int(mask.sum())
+    aggregated = index.aggregate(COLS, LAYOUT, bits, scalars(backend, mask) if bits is not None else None)
+    assert_same(aggregated, backend.aggregate(COLS, LAYOUT, ranking, group))
+
+
+def test_whole_bin_filters_are_evaluated_by_the_index(frame):
+    _, index = frame
+    ranking = ServerRankingDump(dict(filter=[number(0.2, 0.59), number(0.25, 0.6), date(to_millis(BUCKETS[1]) - 3600000, None)]))
+    bits, remaining = index.filter(ranking.filter)
+    assert [c.filter.min for c in remaining] == [0.25]
+    assert bits is not None
@@ -0,0 +1,40 @@
+from lineup_remote.cache import ResultCache
+
+
+def test_the_least_recently_used_entries_are_evicted_by_size():
+    cache = ResultCache(max_entries=10, max_size=100)
+    cache.put("a", 1, "A", 40)
+    cache.put("b", 1, "B", 40)
+    assert cache.get("a", 1) == "A"
+    cache.put("c", 1, "C", 40)
+    # b was used least recently
+    assert cache.get("b", 1) is None
+    assert cache.get("a", 1) == "A" and cache.get("c", 1) == "C"
+    assert cache.size == 80 and cache.stats()["evictions"] == 1
+
+    # replacing an entry replaces its size, entries larger than the cache are not kept at all
+    cache.put("a", 1, "A2", 10)
+    cache.put("d", 1, "D", 101)
+    assert cache.size == 50 and cache.get("a", 1) == "A2" and cache.get("d", 1) is None
+
+
+def test_the_least_recently_used_entries_are_evicted_by_count():
+    cache = ResultCache(max_entries=2)
+    cache.put("a", 1, "A", 1)
+    cache.put("b", 1, "B", 1)
+    assert cache.touch("a", 1) and not cache.touch("x", 1)
+    cache.put("c", 1, "C", 1)
+    assert cache.get("b", 1) is None and cache.get("a", 1) == "A"
+    # touch does not count as a hit
+    assert cache.stats()["hits"] == 1
+
+
+def test_another_version_drops_all_entries():
+    cache = ResultCache()
+    cache.put("a", 1, "A", 10)
+    assert cache.get("a", 2) is None
+    assert cache.size == 0 and cache.stats()["invalidations"] == 1
+    cache.put("a", 2, "A2", 10)
+    # any other version, also an older one, replaces the entries
+    assert cache.get("a", 1) is None
+    assert cache.get("a", 2) is None
@@ -0,0 +1,54 @@
+import random
+from typing import List
+
+import pytest
+
+from lineup_remote.delta import apply_delta, delta_size, to_delta
+
+PREVIOUS = [1, 2, 3, 4, 5]
+
+
+@pytest.mark.parametrize(
+    "current",
+    [
+        [1, 2, 3, 4, 5],
+        [5, 4, 3, 2, 1],
+        [4, 5, 9, 1, 2],
+        [1, 3, 5],
+        [0, 1, 2, 3, 4, 5, 6],
+        [7, 8, 9],
+        [],
+    ],
+)
+def test_apply_delta_restores_the_current_order(current: List[int]):
+    assert apply_delta(PREVIOUS, to_delta(PREVIOUS, current)) == current
+
+
+def test_apply_delta_to_an_empty_previous_order():
+    segments = to_delta([], [3, 1, 2])
+    assert segments == [{"insert": [3, 1, 2]}]
+    assert apply_delta([], segments) == [3, 1, 2]
+
+
+def test_unchanged_and_moved_ranges_are_copied():
+    assert to_delta(PREVIOUS, PREVIOUS) == [{"copy": [0, 5]}]
+    assert to_delta(PREVIOUS, [4, 5, 9, 1, 2]) == [{"copy": [3, 2]}, {"insert": [9]}, {"copy": [0, 2]}]
+
+
+def test_random_edits_round_trip():
+    rng = random.Random(42)
+    for _ in range(50):
+        previous = rng.sample(range(1000), 200)
+        current = list(previous)
+        # a few swaps, removals and inserted new ids like after a data change
+        for _ in range(rng.randint(0, 10)):
+            i, j = rng.randrange(len(current)), rng.randrange(len(current))
+            current[i], current[j] = current[j], current[i]
+        start = rng.randrange(len(current))
+        del current[start : start + rng.randint(0, 5)]
+        for new_id in range(1000, 1000 + rng.randint(0, 5)):
+            current.insert(rng.randrange(len(current) + 1), new_id)
+
+        segments = to_delta(previous, current)
+        assert apply_delta(previous, segments) == current
+        assert delta_size(segments) <= 2 * len(current)
@@ -0,0 +1,98 @@
+import json
+import struct
+from typing import Any, Dict, List, Sequence, Tuple
+
+import pytest
+
+from lineup_remote.encoding import encode_arrow, encode_sort, stream_arrow, stream_json, to_arrow_schema
+
+
+def decode_sort(data: bytes) -> Dict[str, Any]:
+    # counterpart of decodeSort in src/index.ts
+    (header_length,) = struct.unpack_from("<I", data, 0)
+    header = json.loads(data[4 : 4 + header_length].decode("utf-8"))
+    offset = 4 + header_length
+    assert data[offset : offset + -offset % 4].strip() == b""
+    offset += -offset % 4
+    for group in header["groups"]:
+        if "delta" in group:
+            continue
+        group["order"] = list(struct.unpack_from("<{0}i".format(group["length"]), data, offset))
+        offset += 4 * group["length"]
+    assert offset == len(data)
+    return header
+
+
+@pytest.mark.parametrize("name", ["a", "ab", "abc", "abcd", "Ümlaut"])
+def test_encode_sort_round_trip(name: str):
+    result = dict(
+        groups=[dict(name=name, color="gray", order=[3, 1, 2**31 - 1]), dict(name="empty", color="gray", order=[]), dict(name="x", color="red", order=[0])],
+        maxDataIndex=2**31 - 1,
+        token="t",
+    )
+    data = encode_sort(result)
+    # the orders start at a multiple of 4 such that they can be viewed as Int32Array, 4 ids follow
+    start = len(data) - 4 * 4
+    assert start % 4 == 0 and 0 <= start - 4 - struct.unpack_from("<I", data, 0)[0] < 4
+
+    decoded = decode_sort(data)
+    assert decoded["maxDataIndex"] == 2**31 - 1 and decoded["token"] == "t"
+    assert [(g["name"], g["color"], g["length"], g["order"]) for g in decoded["groups"]] == [
+        (name, "gray", 3, [3, 1, 2**31 - 1]),
+        ("empty", "gray", 0, []),
+        ("x", "red", 1, [0]),
+    ]
+
+
+def test_encode_sort_keeps_deltas_in_the_header():
+    delta = [{"copy": [0, 2]}, {"insert": [7]}]
+    result = dict(groups=[dict(name="a", color="gray", delta=delta, length=3), dict(name="b", color="gray", order=[4, 5])], maxDataIndex=7, since="s")
+    decoded = decode_sort(encode_sort(result))
+    assert decoded["since"] == "s"
+    assert decoded["groups"] == [dict(name="a", color="gray", delta=delta, length=3), dict(name="b", color="gray", length=2, order=[4, 5])]
+
+
+def test_encode_arrow_round_trip():
+    import datetime
+    from decimal import Decimal
+
+    # an optional dependency, JSON is used without it
+    pa = pytest.importorskip("pyarrow")
+    schema = to_arrow_schema(["id", "a", "d", "dd"], dict(id="integer", a="numeric", d="text", dd="date"))
+    rows: List[Any] = [(1, Decimal("0.5"), "x", datetime.date(2026, 1, 2)), None, (3, None, None, None)]
+    table = pa.ipc.open_stream(encode_arrow(rows, schema)).read_all()
+    assert table.schema == schema
+    # missing rows are all null
+    assert table.to_pylist() == [
+        dict(id=1, a=0.5, d="x", dd=datetime.date(2026, 1, 2)),
+        dict(id=None, a=None, d=None, dd=None),
+        dict(id=3, a=None, d=None, dd=None),
+    ]
+
+
+# batches of an export cursor, the empty one is skipped
+BATCHES: List[Tuple[List[str], Sequence[Sequence[Any]]]] = [(["id", "d"], [(1, "x"), (2, None)]), (["id", "d"], []), (["id", "d"], [(3, "z\n")])]
+ROWS = [dict(id=1, d="x"), dict(id=2, d=None), dict(id=3, d="z\n")]
+
+
+def test_stream_json_round_trip():
+    assert json.loads("".join(stream_json(iter(BATCHES)))) == ROWS
+    assert json.loads("".join(stream_json(iter([])))) == []
+
+
+def test_stream_ndjson_round_trip():
+    lines = "".join(stream_json(iter(BATCHES), ndjson=True)).split("\n")
+    # one object per line and a final newline
+    assert lines[-1] == ""
+    assert [json.loads(line) for line in lines[:-1]] == ROWS
+    assert "".join(stream_json(iter([]), ndjson=True)) == "\n"
+
+
+def test_stream_arrow_round_trip():
+    pa = pytest.importorskip("pyarrow")
+    schema = to_arrow_schema(["id", "d"], dict(id="integer", d="text"))
+    table = pa.ipc.open_stream(b"".join(stream_arrow(iter(BATCHES), schema))).read_all()
+    assert table.to_pylist() == ROWS
+    # just the schema without any batch
+    empty = pa.ipc.open_stream(b"".join(stream_arrow(iter([]), schema))).read_all()
+    assert empty.schema == schema and empty.num_rows == 0
@@ -0,0 +1,158 @@
+import math
+import os
+from typing import Any, Dict, List
+
+import pytest
+
+# runs the same requests against the postgres and the numpy backend, requires a database with data.sql and functions.sql loaded
+pytestmark = pytest.mark.skipif("LINEUP_DATABASE_URI" not in os.environ, reason="LINEUP_DATABASE_URI is not set")
+
+NUMBER = {"id": "a", "desc": "number@a", "map": {"type": "linear", "domain": [0, 1], "range": [0, 1]}, "groupSortMethod": "median"}
+INVERTED = dict(NUMBER, id="inv", map={"type": "linear", "domain": [0, 1], "range": [1, 0]}, width=100)
+SQRT = dict(NUMBER, id="sqrt", map={"type": "sqrt", "domain": [0, 1], "range": [0, 1]}, width=300)
+LOG = dict(NUMBER, id="log", map={"type": "log", "domain": [0.001, 1], "range": [0, 1]})
+STACK = {"id": "stack", "desc": {"type": "stack", "label": "Score"}, "width": 400, "groupSortMethod": "mean", "children": [INVERTED, SQRT]}
+NESTED = {"id": "nested", "desc": {"type": "nested"}, "width": 100, "children": [{"id": "c2", "desc": "categorical@cat2"}, INVERTED]}
+CATEGORICAL = {"id": "c", "desc": "categorical@cat"}
+STRING = {"id": "s", "desc": "string@d"}
+DATE = {"id": "x", "desc": "date@dd"}
+
+NUMBER_FILTER = dict(NUMBER, filter={"min": 0.2, "max": 0.9, "filterMissing": False})
+CATEGORICAL_FILTER = dict(CATEGORICAL, filter={"filter": ["c1", "c2"], "filterMissing": True})
+# the first half of 2026 in milliseconds, not aligned to days
+DATE_FILTER = dict(DATE, filter={"min": 1767225600000 + 3600000, "max": 1782864000000 - 3600000, "filterMissing": True})
+
+
+def ranking(sort: List[Any], filters: List[Any] = (), groups: List[Any] = (), group_sort: List[Any] = ()) -> Dict[str, Any]:
+    return dict(filter=list(filters), sortCriteria=sort, groupCriteria=list(groups), groupSortCriteria=list(group_sort))
+
+
+def asc(col: Dict[str, Any]) -> Dict[str, Any]:
+    return dict(col=col, asc=True)
+
+
+def desc(col: Dict[str, Any]) -> Dict[str, Any]:
+    return dict(col=col, asc=False)
+
+
+RANKINGS = dict(
+    number=ranking([desc(NUMBER)], [NUMBER_FILTER]),
+    inverted=ranking([asc(INVERTED)]),
+    log=ranking([asc(LOG)]),
+    stack=ranking([desc(STACK)], [CATEGORICAL_FILTER]),
+    nested=ranking([asc(NESTED)]),
+    string=ranking([asc(STRING)]),
+    categorical=ranking([desc(CATEGORICAL), asc(NUMBER)]),
+    date=ranking([asc(DATE)], [DATE_FILTER]),
+    grouped=ranking([asc(STACK)], [NUMBER_FILTER], [CATEGORICAL], [desc(STACK)]),
+    grouped_categorical=ranking([asc(NUMBER)], [], [CATEGORICAL], [desc(CATEGORICAL)]),
+    grouped_unsorted=ranking([desc(NUMBER)], [], [CATEGORICAL]),
+    # the groups of a category share its minimum, such that the group name breaks the ties
+    grouped_tied=ranking([asc(NUMBER)], [], [{"id": "c2", "desc": "categorical@cat2"}, CATEGORICAL], [asc(CATEGORICAL)]),
+)
+
+COLUMNS = [
+    dict(type="number", dump=NUMBER),
+    dict(type="boxplot", dump=NUMBER),
+    dict(type="number", dump=LOG),
+    dict(type="number", dump=STACK),
+    dict(type="categorical", dump=CATEGORICAL),
+    dict(type="date", dump=DATE),
+]
+
+
+@pytest.fixture(scope="module")
+def api():
+    from lineup_remote import api
+
+    yield api
+    api.memory_backend = None
+
+
+def indexed_columns(api: Any) -> List[Dict[str, Any]]:
+    # the bitmap index bins the number columns within the domain of their description
+    domain = next(d["domain"] for d in api.get_metadata().desc if d["column"] == "a")
+    number = dict(NUMBER, map=dict(NUMBER["map"], domain=domain))
+    return [dict(type="number", dump=number), dict(type="categorical", dump=CATEGORICAL), dict(type="date", dump=DATE)]
+
+
+def run(api: Any, columns: List[Dict[str, Any]] = COLUMNS) -> Dict[str, Any]:
+    client = api.app.app.test_client()
+    api.sort_cache.clear()
+    out: Dict[str, Any] = {}
+    for name, r in RANKINGS.items():
+        out["sort " + name] = client.post("/api/ranking/sort", json=r).get_json()
+        out["window " + name] = client.post("/api/ranking/sort?offset=5&limit=10", json=r).get_json()
+        out["stats " + name] = client.post("/api/ranking/stats", json=dict(ranking=r, columns=columns)).get_json()
+        groups = client.post("/api/ranking/groups/stats", json=dict(ranking=r, columns=columns)).get_json()
+        out["group stats " + name] = sorted(groups, key=lambda g: g["name"])
+    out["stats"] = client.post("/api/stats", json=columns).get_json()
+    invalid = ranking([asc(dict(NUMBER, map={"type": "log", "domain": [0, 1], "range": [0, 1]}))])
+    out["invalid"] = client.post("/api/ranking/sort", json=invalid).status_code
+    return out
+
+
+def assert_same(a: Any, b: Any, path: str = ""):
+    if isinstance(a, float) or isinstance(b, float):
+        assert a is not None and b is not None and math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-12), path
+    elif isinstance(a, dict) and isinstance(b, dict):
+        assert set(a) == set(b), path
+        for k in a:
+            assert_same(a[k], b[k], path + "." + k)
+    elif isinstance(a, list) and isinstance(b, list):
+        assert len(a) == len(b), path
+        for i, (x, y) in enumerate(zip(a, b)):
+            assert_same(x, y, "{0}[{1}]".format(path, i))
+    else:
+        assert a == b, path
+
+
+@pytest.mark.parametrize("bitmap", [False, True])
+def test_backends_return_the_same_results(api, bitmap: bool):
+    from lineup_remote.numpy_backend import NumpyBackend
+
+    api.memory_backend = None
+    columns = indexed_columns(api) if bitmap else COLUMNS
+    api.BITMAP_INDEX = bitmap
+    try:
+        database = run(api, columns)
+        assert (api.bitmap_index is not None) == bitmap
+    finally:
+        api.BITMAP_INDEX = False
+        api.bitmap_index = None
+    api.memory_backend = NumpyBackend.load(api.db_session.get_bind(), api.TABLE, api.get_data_version())
+    memory = run(api, columns)
+    assert database["invalid"] == 400
+    for key in database:
+        assert_same(database[key], memory[key], key)
+
+
+def test_map_value_outside_of_the_transformation_domain(api):
+    import numpy as np
+    from lineup_remote.model import MappingFunction
+    from lineup_remote.numpy_backend import map_value
+
+    values = [-1.0, 0.0, 0.5]
+    for mapping_type in ("log", "sqrt", "pow1.1"):
+        mapping = MappingFunction(dict(type=mapping_type, domain=[0.5, 1], range=[0, 1]))
+        database = [
+            api.db_session.scalar("select map_value(:v, :t, 0.5, 1, 0, 1)", params=dict(v=v, t=mapping_type)) for v in values
+        ]
+        memory = map_value(np.array(values), mapping).tolist()
+        assert [v is None for v in database] == [math.isnan(v) for v in memory], mapping_type
+        assert_same([v for v in database if v is not None], [v for v in memory if not math.isnan(v)], mapping_type)
+
+
+def test_approximate_boxplot_of_an_empty_selection(api):
+    api.memory_backend = None
+    api.BOXPLOT_MODE = "approximate"
+    try:
+        client = api.app.app.test_client()
+        empty = ranking([asc(NUMBER)], [dict(NUMBER, filter={"min": 2, "max": 3, "filterMissing": True})])
+        response = client.post("/api/ranking/stats", json=dict(ranking=empty, columns=[dict(type="boxplot", dump=NUMBER)]))
+        assert response.status_code == 200
+        for stats in response.get_json()[0].values():
+            assert stats["count"] == 0 and stats["approximate"]
+            assert stats["min"] is None and stats["median"] is None and stats["outlier"] == []
+    finally:
+        api.BOXPLOT_MODE = "auto"
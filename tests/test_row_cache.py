@@ -0,0 +1,55 @@
+from lineup_remote.row_cache import RowCache
+
+COLUMNS = ["id", "a"]
+
+
+def rows(*ids: int):
+    return [(i, i / 10) for i in ids]
+
+
+def test_next_ids_follow_the_last_sort_order():
+    cache = RowCache(100, prefetch=3)
+    cache.set_order([[5, 3, 9], [1, 7, 2, 8]], 1, "key")
+    assert cache.has_order("key", 1) and not cache.has_order("key", 2)
+
+    assert cache.next_ids([], 1) == [5, 3, 9]
+    # the order continues across the groups
+    assert cache.next_ids([4, 3], 1) == [9, 1, 7]
+    assert cache.next_ids([8], 1) == []
+    # unknown ids and orders of another version have no following rows
+    assert cache.next_ids([4], 1) == []
+    assert cache.next_ids([3], 2) == []
+
+    # cached rows are not loaded again
+    cache.put(rows(1), 1, COLUMNS)
+    assert cache.next_ids([9], 1) == [7, 2]
+
+
+def test_a_newer_version_replaces_the_rows():
+    cache = RowCache(100)
+    cache.put(rows(1, 2), 1, COLUMNS)
+    assert cache.get([1, 2, 3], 1, COLUMNS) == dict(zip([1, 2], rows(1, 2)))
+
+    cache.put(rows(3), 2, COLUMNS)
+    assert cache.get([1, 2, 3], 2, COLUMNS) == dict(zip([3], rows(3)))
+    # late rows of an older version are ignored
+    cache.put(rows(1), 1, COLUMNS)
+    assert cache.get([1], 2, COLUMNS) == {}
+    assert cache.get([3], 1, COLUMNS) == {}
+    # other columns replace the rows as well
+    assert cache.get([3], 2, ["id"]) == {}
+    stats = cache.stats()
+    assert stats["invalidations"] == 2 and stats["hits"] == 3
+
+
+def test_the_least_recently_used_rows_are_evicted():
+    cache = RowCache(3)
+    cache.put(rows(1, 2, 3), 1, COLUMNS)
+    cache.get([1], 1, COLUMNS)
+    cache.put(rows(4) + [None], 1, COLUMNS)
+    assert sorted(cache.get([1, 2, 3, 4], 1, COLUMNS)) == [1, 3, 4]
+    assert cache.stats()["evictions"] == 1
+
+    disabled = RowCache(0)
+    disabled.put(rows(1), 1, COLUMNS)
+    assert disabled.get([1], 1, COLUMNS) == {}
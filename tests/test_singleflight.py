@@ -0,0 +1,85 @@
+import threading
+from typing import List
+
+import pytest
+
+from lineup_remote.singleflight import SingleFlight
+
+
+def test_followers_receive_the_result_of_the_leader():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls: List[int] = []
+
+    def leader():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "result"
+
+    results: List[str] = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("key", leader)))]
+    threads[0].start()
+    started.wait(5)
+    waiting = threading.Semaphore(0)
+    for _ in range(3):
+        threads.append(threading.Thread(target=lambda: results.append(flight.do("key", lambda: "follower", waiting.release))))
+        threads[-1].start()
+    for _ in range(3):
+        assert waiting.acquire(timeout=5)
+    release.set()
+    for t in threads:
+        t.join(5)
+
+    assert results == ["result"] * 4
+    assert calls == [1]
+    stats = flight.stats()
+    assert stats["executions"] == 1 and stats["coalesced"] == 3 and stats["waiting"] == 0 and stats["inFlight"] == 0
+
+
+def test_followers_receive_the_exception_of_the_leader():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def leader():
+        started.set()
+        release.wait(5)
+        raise ValueError("failed")
+
+    errors: List[BaseException] = []
+
+    def call(fn, on_wait=None):
+        try:
+            flight.do("key", fn, on_wait)
+        except ValueError as e:
+            errors.append(e)
+
+    first = threading.Thread(target=call, args=(leader,))
+    first.start()
+    started.wait(5)
+    waited = threading.Event()
+    second = threading.Thread(target=call, args=(lambda: None, waited.set))
+    second.start()
+    assert waited.wait(5)
+    release.set()
+    first.join(5)
+    second.join(5)
+
+    assert [str(e) for e in errors] == ["failed", "failed"]
+    assert flight.stats()["errors"] == 1
+
+
+def test_a_call_after_the_leader_finished_executes_again():
+    flight = SingleFlight()
+    assert flight.do("key", lambda: 1) == 1
+    with pytest.raises(KeyError):
+        flight.do("key", lambda: {}["missing"])
+    # neither the result nor the exception of a finished execution is reused
+    assert flight.do("key", lambda: 2) == 2
+    assert flight.stats()["executions"] == 3 and flight.stats()["coalesced"] == 0
+
+
+def test_disabled_calls_are_not_coalesced():
+    flight = SingleFlight(False)
+    assert flight.do("key", lambda: 1) == 1
+    assert flight.stats()["executions"] == 0